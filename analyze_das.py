@@ -1,11 +1,24 @@
 import os
 import json
-import fitz
-import google.generativeai as genai
-from google.cloud import aiplatform
-from google.cloud import secretmanager
-from fpdf import FPDF
-from fpdf.enums import XPos, YPos # New import for updated syntax
+import time
+import asyncio
+import argparse
+import functools
+import contextlib
+import tracing
+import checkpoints
+from concurrent.futures import ProcessPoolExecutor
+from clients import get_secret, get_access_token, configure_genai, get_generative_model
+from pdf_text import iter_pdf_pages
+from chunking import chunk_document, ChunkStats, report_savings
+from chunk_store import open_chunk_store, CHUNK_STORE_PATH
+from lexical_index import open_lexical_index
+from retrieval import search_policies
+from policy_context import assemble_context, CONTEXT_TOKEN_BUDGET
+from claim_dedup import ClaimClusters, embed_claims, shared_result, CLAIM_SIMILARITY_THRESHOLD
+from llm_cache import generate_cached, get_default_cache as get_llm_cache, LLM_CACHE_BYPASS
+from vector_index import get_vector_index, VECTOR_INDEX_BACKEND
+from report_renderer import ReportRenderer, render_report
 
 # --- Configuration ---
 GCP_PROJECT_ID = "crucial-accord-467816-g0"
@@ -13,79 +26,38 @@ INDEX_ENDPOINT_ID = "1298285737891856384"
 DEPLOYED_INDEX_ID = "islington_policy_endpoint_1754245523158"
 GCP_LOCATION = "europe-west2"
 DAS_PDF_FILENAME = "513FE6CDE1C811EC824B005056865ECD.pdf"
+EXTRACT_WORKERS = os.cpu_count() or 1 # Processes used for PyMuPDF page extraction
+DAS_CHUNK_MAX_CHARS = 2000
+GEMINI_MODEL = 'gemini-1.5-flash-latest'
+SUMMARIZE_CONCURRENCY = 4 # Gemini summary calls in flight at once
+SEARCH_CONCURRENCY = 2 # Batched embed + findNeighbors calls in flight at once
+SEARCH_BATCH_SIZE = 16 # Claims waiting in the queue are searched together, up to this many
+RETRIEVAL_CANDIDATES = 8 # Policy chunks retrieved per claim before merging and packing into the prompt
+ANALYZE_CONCURRENCY = 4 # Gemini compliance calls in flight at once
+STAGE_QUEUE_SIZE = 8 # Items buffered between stages before upstream workers wait
+MAX_CONCURRENT_DOCUMENTS = 4 # Batch mode: documents being analysed at once
+NETWORK_MAX_IN_FLIGHT = 16 # Batch mode: Gemini/index calls in flight across all documents
+NETWORK_CALLS_PER_SECOND = 10 # Batch mode: start rate of those calls across all documents
 
-def get_secret(project_id, secret_id, version_id="latest"):
-    client = secretmanager.SecretManagerServiceClient()
-    name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
-    response = client.access_secret_version(request={"name": name})
-    return response.payload.data.decode("UTF-8")
+def summarize_chunk(model, chunk):
+    prompt = f"Read the following text from a Design and Access Statement. Summarize the developer's main claim or promise in a single, concise sentence. Text: '{chunk}'"
+    return generate_cached(model, prompt).strip()
 
-def extract_text_from_pdf(full_pdf_path):
+def search_vector_index_batch(query_texts, index, api_key, lexical_index=None):
+    """Searches all claims at once; returns neighbor lists aligned with query_texts, or an error string."""
     try:
-        doc = fitz.open(full_pdf_path)
-        print(f"✅ Successfully opened '{os.path.basename(full_pdf_path)}'.")
-        full_text = "".join(page.get_text("text") for page in doc)
-        doc.close()
-        return full_text
-    except Exception as e:
-        print(f"❌ Error processing PDF file: {e}")
-        return None
-
-def chunk_text(text, chunk_size=2000, overlap=400):
-    if not text: return []
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start += chunk_size - overlap
-    return chunks
-
-def summarize_claims(text_chunks, api_key):
-    print("\n--- Summarizing developer claims from the DAS ---")
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        summarized_claims = []
-        for i, chunk in enumerate(text_chunks[:3]):
-            print(f"Processing chunk {i+1}...")
-            prompt = f"Read the following text from a Design and Access Statement. Summarize the developer's main claim or promise in a single, concise sentence. Text: '{chunk}'"
-            response = model.generate_content(prompt)
-            summarized_claims.append(response.text.strip())
-        print("✅ Claims summarized successfully.")
-        return summarized_claims
-    except Exception as e:
-        print(f"❌ Error summarizing claims: {e}")
-        return None
-
-def search_vector_index(query_text, api_key):
-    try:
-        genai.configure(api_key=api_key)
-        query_embedding = genai.embed_content(
-            model="models/text-embedding-004",
-            content=query_text,
-            task_type="RETRIEVAL_QUERY"
-        )['embedding']
-    except Exception as e:
-        return f"Error generating embedding: {e}"
-
-    try:
-        index_endpoint = aiplatform.MatchingEngineIndexEndpoint(index_endpoint_name=INDEX_ENDPOINT_ID)
-        result = index_endpoint.find_neighbors(
-            deployed_index_id=DEPLOYED_INDEX_ID,
-            queries=[query_embedding],
-            num_neighbors=1,
+        return search_policies(
+            query_texts, index, api_key, num_neighbors=RETRIEVAL_CANDIDATES, lexical_index=lexical_index
         )
-        return result[0]
     except Exception as e:
-        return f"Error searching index via SDK: {e}"
+        return f"Error searching index: {e}"
 
 def analyze_compliance(developer_claim, policy_text, api_key):
     """Uses Gemini to compare a claim against a policy for non-compliance."""
     print("--- Analyzing for non-compliance ---")
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
+        configure_genai(api_key)
+        model = get_generative_model(GEMINI_MODEL)
 
         prompt = f"""
         You are an expert planning assistant, highly critical of developer proposals in London. Your goal is to find valid grounds for objection based on common planning concerns.
@@ -108,84 +80,458 @@ def analyze_compliance(developer_claim, policy_text, api_key):
 
         Based on this critical analysis, identify the most likely reason for an objection. Summarize this specific point of non-compliance or vagueness in one paragraph.
         """
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return generate_cached(model, prompt).strip()
     except Exception as e:
         return f"Error during compliance analysis: {e}"
 
-def save_results_to_pdf(results_data):
+class StageTimer:
+    """Wall time (first start to last finish) and busy time per pipeline stage."""
+
+    def __init__(self):
+        self.stages = {}
+
+    async def run(self, stage, func, *args):
+        """Runs a blocking call in a worker thread, timing it under stage."""
+        started = time.perf_counter()
+        try:
+            return await asyncio.to_thread(func, *args)
+        finally:
+            finished = time.perf_counter()
+            first, last, busy, calls = self.stages.get(stage, (started, finished, 0.0, 0))
+            self.stages[stage] = (min(first, started), max(last, finished), busy + finished - started, calls + 1)
+
+    def report(self):
+        print("\n--- Pipeline stage timings ---")
+        print(f"{'Stage':<12}{'Calls':>7}{'Wall (s)':>10}{'Busy (s)':>10}")
+        for stage, (first, last, busy, calls) in self.stages.items():
+            print(f"{stage:<12}{calls:>7}{last - first:>10.2f}{busy:>10.2f}")
+
+
+async def _run_workers(count, worker, *downstream):
+    """Runs count copies of worker, then tells each downstream worker to stop."""
+    await asyncio.gather(*(worker() for _ in range(count)))
+    for queue, consumers in downstream:
+        for _ in range(consumers):
+            await queue.put(None)
+
+
+class NetworkBudget:
+    """Caps in-flight network calls and their start rate across every document in a run."""
+
+    def __init__(self, max_in_flight=NETWORK_MAX_IN_FLIGHT, calls_per_second=NETWORK_CALLS_PER_SECOND):
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.interval = 1.0 / calls_per_second if calls_per_second else 0.0
+        self.next_slot = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        now = asyncio.get_running_loop().time()
+        wait = self.next_slot - now
+        self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+
+async def analyze_das_async(das_chunks, index, policy_chunks, api_key, timer=None, budget=None, renderer=None,
+                            lexical_index=None, checkpoint=None):
+    """Runs summarise -> dedup -> search -> analyse as overlapping stages.
+
+    Each stage has its own worker pool and the bounded queues between them
+    apply back-pressure. Claims move on to search as soon as they are
+    summarised; results come back in chunk order whatever order they finish.
+    The dedup stage clusters claims in chunk order by embedding similarity;
+    only the first claim of each cluster is searched and analysed, and its
+    finding is copied to the others with a "shared_with" note. If it has no
+    finding, each member gets the same error as a result of its own, which
+    is not checkpointed, so a re-run retries it. With a
+    checkpoints.StageItems, chunks finished by an earlier run are restored
+    instead of re-analysed and each new finding is recorded as it arrives.
+    A shared NetworkBudget additionally limits calls across documents. If a
+    ReportRenderer is given, findings are laid out in chunk order as soon as
+    they and everything before them are done. A LexicalIndex switches the
+    search stage to hybrid retrieval.
+    """
+    timer = timer or StageTimer()
+    next_result = 0
+
+    async def call(stage, func, *args):
+        async with budget or contextlib.nullcontext():
+            return await timer.run(stage, func, *args)
+
+    configure_genai(api_key)
+    model = get_generative_model(GEMINI_MODEL)
+    chunk_queue = asyncio.Queue()
+    claim_queue = asyncio.Queue(maxsize=STAGE_QUEUE_SIZE)
+    unique_queue = asyncio.Queue(maxsize=STAGE_QUEUE_SIZE)
+    match_queue = asyncio.Queue(maxsize=STAGE_QUEUE_SIZE)
+    results = {}
+    # Representative chunk index -> its result, and -> member claims still waiting for it
+    findings, members = {}, {}
+    # Chunk index -> claim, for chunks restored from the checkpoint
+    restored = {}
+
+    def finish(i, result):
+        nonlocal next_result
+        results[i] = result
+        if checkpoint is not None and i not in restored and result and not _failed(result):
+            checkpoint.put(str(i), result)
+        while next_result in results:
+            ready = results[next_result]
+            next_result += 1
+            if renderer and ready and "analysis" in ready:
+                renderer.add_result(ready)
+
+    def member_result(result, claim):
+        # Only a finding is shared; an error is not passed off as the member's own analysis
+        if "analysis" in result and not _failed(result):
+            return shared_result(result, claim)
+        return {**result, "claim": claim}
+
+    def finish_cluster(i, result):
+        findings[i] = result
+        finish(i, result)
+        for member, claim in members.pop(i, []):
+            finish(member, member_result(result, claim))
+
+    for i, chunk in enumerate(das_chunks):
+        result = checkpoint.get(str(i)) if checkpoint is not None else None
+        if result is None:
+            chunk_queue.put_nowait((i, chunk))
+        else:
+            restored[i] = result["claim"]
+            finish_cluster(i, result)
+
+    async def summarise_worker():
+        while not chunk_queue.empty():
+            i, chunk = chunk_queue.get_nowait()
+            try:
+                claim = await call("summarise", summarize_chunk, model, chunk)
+            except Exception as e:
+                print(f"❌ Error summarizing chunk {i+1}: {e}")
+                claim = None
+            await claim_queue.put((i, claim))
+
+    async def dedup_worker():
+        clusters = ClaimClusters(CLAIM_SIMILARITY_THRESHOLD)
+        # Restored claims are still clustered, so new near-duplicates can share their findings
+        waiting, next_claim = dict(restored), 0
+        while True:
+            item = await claim_queue.get()
+            if item is None:
+                return
+            waiting[item[0]] = item[1]
+            # Claims are clustered in chunk order, so runs are deterministic and representatives come first
+            ready = []
+            while next_claim in waiting:
+                ready.append((next_claim, waiting.pop(next_claim)))
+                next_claim += 1
+            for i in [i for i, claim in ready if claim is None]:
+                finish(i, None)
+            ready = [(i, claim) for i, claim in ready if claim is not None]
+            vectors = await call("dedup", embed_claims, [claim for _, claim in ready], api_key) if ready else None
+            for n, (i, claim) in enumerate(ready):
+                representative = clusters.add(i, vectors[n]) if vectors is not None else i
+                if i in restored:
+                    continue
+                if representative == i:
+                    await unique_queue.put((i, claim))
+                elif representative in findings:
+                    finish(i, member_result(findings[representative], claim))
+                else:
+                    members.setdefault(representative, []).append((i, claim))
+
+    async def search_worker():
+        done = False
+        while not done:
+            item = await unique_queue.get()
+            if item is None:
+                return
+            batch = [item]
+            # Search whatever else is already waiting alongside it
+            while len(batch) < SEARCH_BATCH_SIZE and not unique_queue.empty():
+                item = unique_queue.get_nowait()
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+            neighbor_lists = await call(
+                "search", search_vector_index_batch, [claim for _, claim in batch], index, api_key, lexical_index
+            )
+            if not isinstance(neighbor_lists, list):
+                neighbor_lists = [neighbor_lists] * len(batch)
+            for (i, claim), neighbors in zip(batch, neighbor_lists):
+                await match_queue.put((i, claim, neighbors))
+
+    async def analyse_worker():
+        while True:
+            item = await match_queue.get()
+            if item is None:
+                return
+            i, claim, search_results = item
+            if isinstance(search_results, list) and len(search_results) > 0:
+                # Adjacent chunks are merged and near-duplicates dropped before packing the budget
+                match_text = assemble_context(search_results, policy_chunks, CONTEXT_TOKEN_BUDGET)
+                analysis_result = await call("analyse", analyze_compliance, claim, match_text, api_key)
+                finish_cluster(i, {"claim": claim, "analysis": analysis_result})
+            else:
+                finish_cluster(i, {"claim": claim, "error": search_results})
+
+    await asyncio.gather(
+        _run_workers(SUMMARIZE_CONCURRENCY, summarise_worker, (claim_queue, 1)),
+        _run_workers(1, dedup_worker, (unique_queue, SEARCH_CONCURRENCY)),
+        _run_workers(SEARCH_CONCURRENCY, search_worker, (match_queue, ANALYZE_CONCURRENCY)),
+        _run_workers(ANALYZE_CONCURRENCY, analyse_worker),
+    )
+    return [results[i] for i in sorted(results) if results[i] is not None]
+
+
+def _failed(result):
+    """True for transient failures, which are retried on the next run rather than checkpointed.
+
+    A search that ran and found no policy ("error": []) is a final result.
+    """
+    if "analysis" in result:
+        return result["analysis"].startswith("Error during")
+    return result.get("error") != []
+
+
+async def analyze_with_checkpoints(pipeline, das_chunks, index, policy_chunks, api_key, renderer=None, **kwargs):
+    """analyze_das_async, reusing a finished analysis or resuming a partial one with the same inputs.
+
+    The inputs are the extracted chunks, the analysis settings and the
+    policy chunk store; the stage is saved once every chunk has a final result.
+    """
+    inputs = [pipeline.output_hash("extract"), GEMINI_MODEL, RETRIEVAL_CANDIDATES, CONTEXT_TOKEN_BUDGET,
+              CLAIM_SIMILARITY_THRESHOLD, checkpoints.file_hash(CHUNK_STORE_PATH + ".idx")]
+    results = pipeline.load("analyse", inputs)
+    if results is not None:
+        for result in results:
+            if renderer and "analysis" in result:
+                renderer.add_result(result)
+        return results
+    items = pipeline.items("analyse", inputs)
+    results = await analyze_das_async(das_chunks, index, policy_chunks, api_key, renderer=renderer,
+                                      checkpoint=items, **kwargs)
+    if len(items) == len(das_chunks):
+        pipeline.save("analyse", inputs, results)
+    return results
+
+def save_results_to_pdf(results_data, pdf_output_path="objection_report.pdf"):
     """Takes a list of claims and analyses and saves them to a PDF."""
     print("\n--- Generating PDF Report ---")
-    pdf = FPDF()
-    # Add the Unicode font
-    pdf.add_font("DejaVu", "", "DejaVuSans.ttf")
-    pdf.add_font("DejaVu", "B", "DejaVuSans-Bold.ttf") # Assumes you download the bold version too for titles
-    pdf.add_page()
-
-    # Use the Unicode font
-    pdf.set_font("DejaVu", 'B', 16)
-    # Use modern syntax to avoid warnings
-    pdf.cell(0, 10, text="Planning Objection Analysis Report", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-    pdf.ln(10)
-
-    for result in results_data:
-        pdf.set_font("DejaVu", 'B', 12)
-        pdf.multi_cell(0, 5, text=f"[Developer Claim]: {result['claim']}")
-        pdf.ln(5)
-        pdf.set_font("DejaVu", '', 12)
-        pdf.multi_cell(0, 5, text=f"[Compliance Analysis]: {result['analysis']}")
-        pdf.ln(10)
-
-    pdf_output_path = "objection_report.pdf"
-    pdf.output(pdf_output_path)
+    render_report(results_data, pdf_output_path)
     print(f"✅ Report saved to {pdf_output_path}")
 
 
-# --- Main Execution Block ---
-if __name__ == "__main__":
+def extract_das_chunks(das_pdf_path):
+    """Extracts and chunks one DAS; runs in a batch worker process."""
+    return [chunk.text for chunk in chunk_document(iter_pdf_pages(das_pdf_path), max_chars=DAS_CHUNK_MAX_CHARS)]
+
+
+def chunk_das_pdf(das_pdf_path):
+    """Extracts and chunks one DAS with a savings report; returns None on failure."""
     try:
-        with open("policy_chunks.json", "r") as f:
-            policy_chunks = json.load(f)
-    except FileNotFoundError:
-        print("❌ Error: policy_chunks.json not found. Please run extract_text.py first.")
-        exit()
+        stats = ChunkStats()
+        pages = iter_pdf_pages(das_pdf_path, workers=EXTRACT_WORKERS)
+        texts = [chunk.text for chunk in chunk_document(pages, DAS_CHUNK_MAX_CHARS, stats)]
+        report_savings(stats, chunk_size=DAS_CHUNK_MAX_CHARS, overlap=400)
+        return texts
+    except Exception as e:
+        print(f"❌ Error processing PDF file: {e}")
+        return None
 
-    print("🔐 Fetching secrets...")
-    GOOGLE_API_KEY = get_secret(GCP_PROJECT_ID, "google-api-key")
-    aiplatform.init(project=GCP_PROJECT_ID, location=GCP_LOCATION)
-    print("✅ Secrets fetched and AI Platform initialized.")
 
+def find_das_pdfs(source):
+    """PDF paths from a folder, or from a manifest file listing one path per line."""
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source) if name.lower().endswith(".pdf"))
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, "r") as f:
+        return [os.path.join(base, line.strip()) for line in f if line.strip() and not line.startswith("#")]
+
+
+def application_names(das_pdf_paths):
+    """One unique report name per PDF: its file name, plus a hash of its full path where file names collide.
+
+    The same path listed twice also gets a position suffix, so no two
+    entries ever share a report.
+    """
+    names = [os.path.splitext(os.path.basename(path))[0] for path in das_pdf_paths]
+    counts = {name: names.count(name) for name in names}
+    unique, seen = [], set()
+    for position, (name, path) in enumerate(zip(names, das_pdf_paths)):
+        if counts[name] > 1:
+            name = f"{name}-{checkpoints.content_hash(os.path.abspath(path))[:8]}"
+        if name in seen:
+            name = f"{name}-{position + 1}"
+        seen.add(name)
+        unique.append(name)
+    return unique
+
+
+async def analyze_batch(das_pdf_paths, index, policy_chunks, api_key, out_dir="reports", lexical_index=None,
+                        fresh=False):
+    """Analyses many DAS PDFs, writing one report per application plus summary.json.
+
+    Extraction runs in a process pool; the network stages of every document
+    share one NetworkBudget. A failing document is recorded in the summary
+    and does not stop the others. Each document checkpoints its own stages,
+    so a re-run only redoes documents, and claims, that did not finish.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    timer = StageTimer()
+    budget = NetworkBudget()
+    documents = asyncio.Semaphore(MAX_CONCURRENT_DOCUMENTS)
+    loop = asyncio.get_running_loop()
+
+    with ProcessPoolExecutor(max_workers=EXTRACT_WORKERS) as pool:
+        async def analyze_one(das_pdf_path, application):
+            entry = {"application": application, "pdf": das_pdf_path}
+            started = time.perf_counter()
+            try:
+                pipeline = checkpoints.Pipeline(application, fresh=fresh)
+                inputs = [await asyncio.to_thread(checkpoints.file_hash, das_pdf_path), DAS_CHUNK_MAX_CHARS]
+                das_chunks = pipeline.load("extract", inputs)
+                if das_chunks is None:
+                    das_chunks = await loop.run_in_executor(pool, extract_das_chunks, das_pdf_path)
+                    pipeline.save("extract", inputs, das_chunks)
+                async with documents:
+                    results = await analyze_with_checkpoints(pipeline, das_chunks, index, policy_chunks, api_key,
+                                                             timer=timer, budget=budget, lexical_index=lexical_index)
+                report_data = [result for result in results if "analysis" in result]
+                report_path = os.path.join(out_dir, f"{application}.pdf") if report_data else None
+                if report_data:
+                    # Worker processes keep their parsed fonts, so reports render in parallel
+                    await loop.run_in_executor(pool, render_report, report_data, report_path)
+                entry.update(status="ok", chunks=len(das_chunks), claims=len(results),
+                             shared=sum("shared_with" in result for result in results),
+                             findings=len(report_data), report=report_path)
+            except Exception as e:
+                print(f"❌ Error analyzing {application}: {e}")
+                entry.update(status="failed", error=str(e))
+            entry["seconds"] = round(time.perf_counter() - started, 2)
+            return entry
+
+        summary = await asyncio.gather(*(
+            analyze_one(path, application) for path, application in zip(das_pdf_paths, application_names(das_pdf_paths))
+        ))
+
+    summary_path = os.path.join(out_dir, "summary.json")
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    timer.report()
+    print("\n--- Batch Summary ---")
+    for entry in summary:
+        if entry["status"] == "ok":
+            print(f"✅ {entry['application']}: {entry['findings']} findings from {entry['claims']} claims ({entry['seconds']}s)")
+        else:
+            print(f"❌ {entry['application']}: {entry['error']}")
+    print(f"✅ Summary saved to {summary_path}")
+    return summary
+
+
+def open_analysis_index():
+    """The configured vector index backend, set up for findNeighbors."""
+    # The local backend runs offline and needs no access token
+    access_token = functools.partial(get_access_token, GCP_PROJECT_ID) if VECTOR_INDEX_BACKEND == "vertex" else None
+    return get_vector_index(
+        access_token=access_token, project_id=GCP_PROJECT_ID, location=GCP_LOCATION,
+        index_endpoint_id=INDEX_ENDPOINT_ID, deployed_index_id=DEPLOYED_INDEX_ID
+    )
+
+
+def analyze_claim(claim, index, policy_chunks, api_key, lexical_index=None):
+    """Searches and analyses a single claim or objection, as the pipeline does for each DAS chunk."""
+    search_results = search_vector_index_batch([claim], index, api_key, lexical_index)
+    if not isinstance(search_results, list) or not search_results[0]:
+        return {"claim": claim, "error": search_results if isinstance(search_results, str) else "No policy found"}
+    policy_text = assemble_context(search_results[0], policy_chunks, CONTEXT_TOKEN_BUDGET)
+    return {"claim": claim, "analysis": analyze_compliance(claim, policy_text, api_key),
+            "policies": [neighbor.id for neighbor in search_results[0]]}
+
+
+def default_das_pdf_path():
     try:
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        das_pdf_path = os.path.join(script_dir, '..', 'data sources for Islington', DAS_PDF_FILENAME)
+        return os.path.join(script_dir, '..', 'data sources for Islington', DAS_PDF_FILENAME)
     except NameError:
-        das_pdf_path = os.path.join('..', 'data sources for Islington', DAS_PDF_FILENAME)
+        return os.path.join('..', 'data sources for Islington', DAS_PDF_FILENAME)
+
+
+def run_analysis(pdfs=(), batch=None, out_dir="reports", fresh=False):
+    """Analyses one DAS into objection_report.pdf, or several (or a --batch source) into out_dir."""
+    try:
+        policy_chunks = open_chunk_store()
+    except FileNotFoundError:
+        print("❌ Error: policy chunk store not found. Please run extract_text.py first.")
+        return
+    # BM25 + policy-code lookup; bare policy references skip the embedding and index calls
+    lexical_index = open_lexical_index()
 
-    das_text = extract_text_from_pdf(das_pdf_path)
-    if das_text:
-        das_chunks = chunk_text(das_text)
-        claims = summarize_claims(das_chunks, GOOGLE_API_KEY)
+    print("🔐 Fetching secrets...")
+    GOOGLE_API_KEY = get_secret(GCP_PROJECT_ID, "google-api-key")
+    index = open_analysis_index()
+    print("✅ Secrets fetched and vector index initialized.")
+
+    if batch or len(pdfs) > 1:
+        das_pdf_paths = list(pdfs) + (find_das_pdfs(batch) if batch else [])
+        print(f"\n--- Analyzing {len(das_pdf_paths)} Design and Access Statements ---")
+        asyncio.run(analyze_batch(das_pdf_paths, index, policy_chunks, GOOGLE_API_KEY, out_dir, lexical_index, fresh))
+        return
+
+    das_pdf_path = pdfs[0] if pdfs else default_das_pdf_path()
+
+    # Stages whose inputs match an earlier run are reused, and an interrupted analysis resumes
+    pipeline = checkpoints.Pipeline(os.path.splitext(os.path.basename(das_pdf_path))[0], fresh=fresh)
+    das_chunks = pipeline.run("extract", [checkpoints.file_hash(das_pdf_path), DAS_CHUNK_MAX_CHARS],
+                              chunk_das_pdf, das_pdf_path)
 
-        if claims:
+    if das_chunks:
+        print("\n--- Summarizing, searching and analyzing developer claims ---")
+        timer = StageTimer()
+        # Findings are laid out as they arrive; the file is written at the end
+        renderer = ReportRenderer("objection_report.pdf")
+        results = asyncio.run(analyze_with_checkpoints(
+            pipeline, das_chunks, index, policy_chunks, GOOGLE_API_KEY, renderer, timer=timer, lexical_index=lexical_index
+        ))
+        timer.report()
+        shared = sum("shared_with" in result for result in results)
+        if shared:
+            print(f"✅ {shared} of {len(results)} claims were near-duplicates and reused an earlier finding.")
+        if not LLM_CACHE_BYPASS:
+            llm_stats = get_llm_cache().stats()
+            print(f"✅ LLM cache: {llm_stats['hits']} hits, {llm_stats['misses']} misses, "
+                  f"saved ~{llm_stats['tokens_saved']:,} tokens and {llm_stats['seconds_saved']:.1f}s.")
+
+        if results:
             print("\n--- Potential Objection Points Found ---")
-            report_data = []
-            for claim in claims:
-                print(f"\n[Developer Claim]: {claim}")
-                search_results = search_vector_index(claim, GOOGLE_API_KEY)
-
-                if isinstance(search_results, list) and len(search_results) > 0:
-                    neighbor = search_results[0]
-                    match_id = int(neighbor.id)
-                    match_text = policy_chunks[match_id]
-
-                    analysis_result = analyze_compliance(claim, match_text, GOOGLE_API_KEY)
-                    print(f"[Compliance Analysis]: {analysis_result}")
-                    report_data.append({"claim": claim, "analysis": analysis_result})
+            for result in results:
+                print(f"\n[Developer Claim]: {result['claim']}")
+                if "analysis" in result and "shared_with" in result:
+                    print(f"[Compliance Analysis, shared with \"{result['shared_with']}\"]: {result['analysis']}")
+                elif "analysis" in result:
+                    print(f"[Compliance Analysis]: {result['analysis']}")
                 else:
-                    print(f"[No relevant policy found or error in search]: {search_results}")
+                    print(f"[No relevant policy found or error in search]: {result['error']}")
+
+            # To make the bold font work, you also need to download 'DejaVuSans-Bold.ttf'
+            # and place it in the same folder.
+            # You can get it here: https://github.com/dejavu-fonts/dejavu-fonts/blob/master/ttf/DejaVuSans-Bold.ttf?raw=true
+            if renderer.close():
+                print(f"\n✅ Report saved to {renderer.output}")
+
 
-            if report_data:
-                # To make the bold font work, you also need to download 'DejaVuSans-Bold.ttf'
-                # and place it in the same folder.
-                # You can get it here: https://github.com/dejavu-fonts/dejavu-fonts/blob/master/ttf/DejaVuSans-Bold.ttf?raw=true
-                save_results_to_pdf(report_data)
\ No newline at end of file
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find grounds for objection in Design and Access Statements.")
+    parser.add_argument("pdfs", nargs="*", help=f"DAS PDFs to analyze (default: {DAS_PDF_FILENAME})")
+    parser.add_argument("--batch", help="Folder of DAS PDFs, or a manifest file listing one PDF path per line")
+    parser.add_argument("--out-dir", default="reports", help="Where batch reports and summary.json are written")
+    tracing.add_arguments(parser)
+    checkpoints.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.start(args.trace, args.profile)
+    run_analysis(args.pdfs, args.batch, args.out_dir, args.fresh)
@@ -0,0 +1,470 @@
+import io
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+from types import SimpleNamespace
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import google.generativeai as genai
+import analyze_das
+import embedding_cache
+import llm_cache
+import tracing
+from pdf_text import iter_pdf_pages
+from chunking import chunk_document, load_policy_chunks
+from embeddings import embed_texts
+from retrieval import search_policies
+from index_sync import chunk_id
+from vector_index import VertexVectorIndex, LocalVectorIndex
+from embedding_store import write_embeddings, EmbeddingFile, recall_check, RECALL_K
+from lexical_index import write_lexical_index, LexicalIndex
+from report_renderer import render_report
+
+# --- Configuration ---
+BENCHMARK_RESULTS_PATH = "benchmark_results.json"
+BENCHMARK_VERSION = 3 # Bumped when stages or result fields change meaning
+POLICY_CHUNKS_PATH = "policy_chunks.json"
+EMBEDDING_DIMENSIONS = 768 # Matches text-embedding-004
+POLICY_COPIES = 20 # The policy fixture is repeated (with distinct text) to get a realistic corpus size
+SEARCH_QUERIES = 256
+MAX_CLAIMS = 64 # DAS chunks sent through the analysis pipeline
+REPORT_RENDERS = 10
+EMBED_LATENCY_MS = 50 # Stand-in latency per embed_content call
+GENERATE_LATENCY_MS = 200 # Stand-in latency per generate_content call
+VERTEX_LATENCY_MS = 20 # Stand-in latency per Vector Search REST call
+
+
+def fake_vector(text, dimensions=EMBEDDING_DIMENSIONS):
+    """Deterministic unit vector for a text, so identical texts are each other's nearest neighbor."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class _Faults:
+    """Seeded latency and error injection shared by the stand-ins."""
+
+    def __init__(self, latency_ms, error_rate, seed):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def call(self):
+        """Sleeps for the configured latency; returns True if this call should fail."""
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+            failed = self.random.random() < self.error_rate
+            self.errors += failed
+        return failed
+
+
+class FakeEmbedder:
+    """Stands in for genai.embed_content."""
+
+    def __init__(self, latency_ms=EMBED_LATENCY_MS, error_rate=0.0, seed=0):
+        self.faults = _Faults(latency_ms, error_rate, seed)
+
+    def __call__(self, model, content, task_type=None, **kwargs):
+        if self.faults.call():
+            raise RuntimeError("429 Quota exceeded (benchmark stand-in)")
+        if isinstance(content, str):
+            return {"embedding": fake_vector(content)}
+        return {"embedding": [fake_vector(text) for text in content]}
+
+
+class FakeGenerativeModel:
+    """Stands in for genai.GenerativeModel with deterministic responses."""
+
+    def __init__(self, model_name, latency_ms=GENERATE_LATENCY_MS, error_rate=0.0, seed=0):
+        self.model_name = model_name
+        self.faults = _Faults(latency_ms, error_rate, seed)
+
+    def generate_content(self, prompt, generation_config=None):
+        if self.faults.call():
+            raise RuntimeError("503 Service Unavailable (benchmark stand-in)")
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        return SimpleNamespace(
+            text=f"Stand-in response {digest}: the claim is vague and gives no verifiable detail.",
+            usage_metadata=SimpleNamespace(total_token_count=len(prompt) // 4 + 20)
+        )
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real endpoint
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        status, payload = self.server.stand_in.handle(self.path, body)
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInVertexServer:
+    """Local HTTP server implementing the Vector Search calls the scripts make.
+
+    Supports upsertDatapoints, removeDatapoints and findNeighbors (exact
+    DOT_PRODUCT_DISTANCE search); failed calls return a 503.
+    """
+
+    def __init__(self, latency_ms=VERTEX_LATENCY_MS, error_rate=0.0, seed=0):
+        self.faults = _Faults(latency_ms, error_rate, seed)
+        self.vectors = {}
+        self.matrix = None
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stand_in = self
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/projects/benchmark/locations/local"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def index(self):
+        """A VertexVectorIndex pointed at this server."""
+        return VertexVectorIndex("benchmark-token", "benchmark", "local", index_id="benchmark",
+                                 index_endpoint_id="benchmark", deployed_index_id="benchmark", base_url=self.url)
+
+    def _snapshot(self):
+        with self.lock:
+            if self.matrix is None:
+                ids = list(self.vectors)
+                rows = [self.vectors[i] for i in ids]
+                self.matrix = (ids, np.asarray(rows, dtype=np.float32).reshape(len(ids), -1))
+            return self.matrix
+
+    def handle(self, path, body):
+        if self.faults.call():
+            return 503, {"error": {"code": 503, "message": "Benchmark stand-in unavailable"}}
+        if path.endswith(":upsertDatapoints"):
+            with self.lock:
+                for datapoint in body["datapoints"]:
+                    self.vectors[datapoint["datapointId"]] = datapoint["featureVector"]
+                self.matrix = None
+            return 200, {}
+        if path.endswith(":removeDatapoints"):
+            with self.lock:
+                for datapoint_id in body["datapointIds"]:
+                    self.vectors.pop(datapoint_id, None)
+                self.matrix = None
+            return 200, {}
+        if path.endswith(":findNeighbors"):
+            ids, matrix = self._snapshot()
+            nearest = []
+            for query in body["queries"]:
+                neighbors = []
+                if ids:
+                    scores = matrix @ np.asarray(query["datapoint"]["featureVector"], dtype=np.float32)
+                    for row in np.argsort(-scores)[:query.get("neighborCount", 1)]:
+                        neighbors.append({"datapoint": {"datapointId": ids[row]}, "distance": float(scores[row])})
+                nearest.append({"neighbors": neighbors})
+            return 200, {"nearestNeighbors": nearest}
+        return 404, {"error": {"code": 404, "message": f"Unknown method {path}"}}
+
+
+class StageRecorder:
+    """Counts items, errors and per-operation latency for one benchmark stage."""
+
+    def __init__(self):
+        self.items = 0
+        self.errors = 0
+        self.last_error = None
+        self.latencies = []
+        self.extra = {}
+
+    @contextlib.contextmanager
+    def operation(self, items=1):
+        """Times one operation; set op["items"] if the count is only known afterwards."""
+        op = {"items": items}
+        started = time.perf_counter()
+        try:
+            yield op
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)[:500]
+        else:
+            self.items += op["items"]
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+    def summary(self, unit, seconds):
+        ordered = sorted(self.latencies)
+
+        def percentile(q):
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2) if ordered else None
+
+        return {
+            "unit": unit, "items": self.items, "operations": len(self.latencies), "errors": self.errors,
+            "seconds": round(seconds, 4), "throughput_per_s": round(self.items / seconds, 2) if seconds else None,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)},
+            "last_error": self.last_error, **self.extra
+        }
+
+
+def run_stage(stages, name, unit, func, *args):
+    """Runs func(recorder, *args) with output suppressed and stores its summary under name."""
+    recorder = StageRecorder()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        value = func(recorder, *args)
+    stages[name] = recorder.summary(unit, time.perf_counter() - started)
+    return value
+
+
+@contextlib.contextmanager
+def stand_ins(workdir, embedder, model):
+    """Routes Gemini calls to the fakes and points both caches at empty files in workdir."""
+    saved = (genai.embed_content, analyze_das.get_generative_model,
+             embedding_cache._default_cache, llm_cache._default_cache)
+    genai.embed_content = embedder
+    analyze_das.get_generative_model = lambda model_name: model
+    embedding_cache._default_cache = embedding_cache.EmbeddingCache(os.path.join(workdir, "embeddings.sqlite"))
+    llm_cache._default_cache = llm_cache.LLMCache(os.path.join(workdir, "llm.sqlite"))
+    try:
+        yield
+    finally:
+        (genai.embed_content, analyze_das.get_generative_model,
+         embedding_cache._default_cache, llm_cache._default_cache) = saved
+
+
+def _extract(recorder, pdf_paths, workers):
+    documents = []
+    for pdf_path in pdf_paths:
+        with recorder.operation() as op:
+            pages = list(iter_pdf_pages(pdf_path, workers=workers))
+            op["items"] = len(pages)
+            documents.append(pages)
+    return documents
+
+
+def _chunk(recorder, documents):
+    das_chunks = []
+    for pages in documents:
+        with recorder.operation() as op:
+            chunks = [chunk.text for chunk in chunk_document(pages, max_chars=2000)]
+            op["items"] = len(chunks)
+            das_chunks.extend(chunks)
+    return das_chunks
+
+
+def _embed(recorder, texts):
+    with recorder.operation(len(texts)):
+        return embed_texts(texts, "benchmark-key")
+
+
+def _upsert(recorder, index, ids, vectors):
+    totals = tracing.get_tracer().totals
+    sent = totals.get("vertex.upsertDatapoints", {}).get("request_bytes", 0)
+    with recorder.operation(len(ids)):
+        index.upsert(ids, vectors)
+    if isinstance(index, VertexVectorIndex):
+        recorder.extra["request_kb"] = round((totals["vertex.upsertDatapoints"]["request_bytes"] - sent) / 1024, 1)
+
+
+def _store(recorder, workdir, ids, vectors):
+    """Writes the vectors in each stored dtype, recording file size and recall against float32."""
+    json_bytes = len(json.dumps(vectors))
+    recorder.extra["json_kb"] = round(json_bytes / 1024, 1)
+    for dtype in ("float32", "float16", "int8"):
+        path = os.path.join(workdir, f"embeddings.{dtype}.emb")
+        with recorder.operation(len(ids)):
+            write_embeddings(path, ids, vectors, dtype)
+        recorder.extra[dtype] = {
+            "kb": round(os.path.getsize(path) / 1024, 1),
+            f"recall_at_{RECALL_K}": round(recall_check(vectors, EmbeddingFile(path)), 4),
+        }
+
+
+def _search(recorder, index, queries, expected_ids, lexical_index=None):
+    hits = 0
+    for start in range(0, len(queries), analyze_das.SEARCH_BATCH_SIZE):
+        batch = queries[start:start + analyze_das.SEARCH_BATCH_SIZE]
+        with recorder.operation(len(batch)):
+            neighbor_lists = search_policies(batch, index, "benchmark-key", lexical_index=lexical_index)
+            hits += sum(bool(n) and n[0].id == expected_ids[start + i] for i, n in enumerate(neighbor_lists))
+    recorder.extra["recall_at_1"] = round(hits / len(queries), 4) if queries else None
+
+
+def _lookup(recorder, lexical_index):
+    for code in lexical_index.codes:
+        with recorder.operation():
+            # No index or API key: a bare policy reference must be answered without any network call
+            if not search_policies([f"Policy {code}"], None, None, lexical_index=lexical_index)[0]:
+                raise RuntimeError(f"No chunk found for Policy {code}")
+
+
+def _analyse(recorder, das_chunks, index, policy_chunks):
+    timer = analyze_das.StageTimer()
+    with recorder.operation(len(das_chunks)):
+        results = asyncio.run(analyze_das.analyze_das_async(das_chunks, index, policy_chunks, "benchmark-key", timer))
+    recorder.extra["pipeline"] = {
+        stage: {"calls": calls, "wall_s": round(last - first, 4), "busy_s": round(busy, 4)}
+        for stage, (first, last, busy, calls) in timer.stages.items()
+    }
+    findings = [result for result in results
+                if "analysis" in result and not result["analysis"].startswith("Error during")]
+    recorder.extra["shared_findings"] = sum("shared_with" in result for result in findings)
+    # Claims lost in summarising, searching or analysing
+    recorder.errors += len(das_chunks) - len(findings)
+    return findings
+
+
+def _render(recorder, report_data, renders):
+    for _ in range(renders):
+        with recorder.operation():
+            render_report(report_data, io.BytesIO())
+    recorder.extra["findings_per_report"] = len(report_data)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(pdf_paths, policy_path=POLICY_CHUNKS_PATH, policy_copies=POLICY_COPIES,
+                  search_queries=SEARCH_QUERIES, max_claims=MAX_CLAIMS, report_renders=REPORT_RENDERS,
+                  embed_latency_ms=EMBED_LATENCY_MS, generate_latency_ms=GENERATE_LATENCY_MS,
+                  vertex_latency_ms=VERTEX_LATENCY_MS, error_rate=0.0, seed=0, workers=1):
+    """Runs every stage offline against the stand-ins and returns the results document."""
+    settings = dict(locals())
+    policy = list(load_policy_chunks(policy_path).values())
+    policy_texts = [text if copy == 0 else f"{text} [copy {copy}]" for copy in range(policy_copies) for text in policy]
+    policy_ids = [chunk_id(text) for text in policy_texts]
+    policy_chunks = dict(zip(policy_ids, policy_texts))
+    query_positions = [i % len(policy_texts) for i in range(search_queries)]
+    queries = [policy_texts[i] for i in query_positions]
+    expected_ids = [policy_ids[i] for i in query_positions]
+
+    embedder = FakeEmbedder(embed_latency_ms, error_rate, seed)
+    model = FakeGenerativeModel(analyze_das.GEMINI_MODEL, generate_latency_ms, error_rate, seed + 1)
+    stages = {}
+    with tempfile.TemporaryDirectory() as workdir, stand_ins(workdir, embedder, model), \
+            StandInVertexServer(vertex_latency_ms, error_rate, seed + 2) as server:
+        documents = run_stage(stages, "extract", "pages", _extract, pdf_paths, workers)
+        das_chunks = run_stage(stages, "chunk", "chunks", _chunk, documents)
+        vectors = run_stage(stages, "embed_cold", "texts", _embed, policy_texts)
+        vectors = vectors or [fake_vector(text) for text in policy_texts]
+        run_stage(stages, "embed_warm", "texts", _embed, policy_texts)
+
+        run_stage(stages, "store_vectors", "datapoints", _store, workdir, policy_ids, vectors)
+        vertex_index = server.index()
+        local_index = LocalVectorIndex(os.path.join(workdir, "vector_index"), mode="exact")
+        run_stage(stages, "upsert_vertex", "datapoints", _upsert, vertex_index, policy_ids, vectors)
+        run_stage(stages, "upsert_local", "datapoints", _upsert, local_index, policy_ids, vectors)
+        run_stage(stages, "search_vertex", "queries", _search, vertex_index, queries, expected_ids)
+        run_stage(stages, "search_local", "queries", _search, local_index, queries, expected_ids)
+        lexical_path = os.path.join(workdir, "policy_lexical.idx")
+        write_lexical_index(zip(policy_ids, policy_texts), lexical_path)
+        lexical_index = LexicalIndex(lexical_path)
+        # Policy-code hits are fused with BM25 and vector rankings, so every query takes the hybrid path
+        run_stage(stages, "search_hybrid", "queries", _search, vertex_index, queries, expected_ids, lexical_index)
+        run_stage(stages, "lookup_exact", "queries", _lookup, lexical_index)
+
+        report_data = run_stage(stages, "analyse", "claims", _analyse,
+                                das_chunks[:max_claims], vertex_index, policy_chunks)
+        if not report_data:
+            report_data = [{"claim": text[:200], "analysis": text} for text in policy[:max_claims]]
+        run_stage(stages, "render", "reports", _render, report_data, report_renders)
+
+    return {
+        "benchmark_version": BENCHMARK_VERSION,
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in settings.items() if key != "policy_path"},
+        "fixtures": {"policy_chunks": len(policy_texts), "pdfs": [os.path.basename(p) for p in pdf_paths],
+                     "das_chunks": len(das_chunks)},
+        "stand_in_calls": {name: {"calls": faults.calls, "errors": faults.errors} for name, faults in
+                           (("embed", embedder.faults), ("generate", model.faults), ("vertex", server.faults))},
+        "stages": stages,
+    }
+
+
+def print_results(results, baseline=None):
+    print("\n--- Benchmark Results ---")
+    print(f"{'Stage':<15}{'Items':>8}{'Errors':>8}{'Seconds':>10}{'Per second':>12}{'p50 ms':>10}{'p95 ms':>10}"
+          + (f"{'vs base':>10}" if baseline else ""))
+    for name, stage in results["stages"].items():
+        line = (f"{name:<15}{stage['items']:>8}{stage['errors']:>8}{stage['seconds']:>10.3f}"
+                f"{stage['throughput_per_s'] or 0:>12.1f}{stage['latency_ms']['p50'] or 0:>10.1f}"
+                f"{stage['latency_ms']['p95'] or 0:>10.1f}")
+        old = (baseline or {}).get("stages", {}).get(name)
+        if old and old.get("throughput_per_s") and stage["throughput_per_s"]:
+            line += f"{stage['throughput_per_s'] / old['throughput_per_s']:>9.2f}x"
+        print(line)
+    store = results["stages"].get("store_vectors")
+    if store:
+        print(f"\nEmbedding storage ({store['json_kb']:.0f} KB as JSON text, Vertex upsert sent "
+              f"{results['stages']['upsert_vertex'].get('request_kb', 0):.0f} KB):")
+        for dtype in ("float32", "float16", "int8"):
+            print(f"  {dtype:<8}{store[dtype]['kb']:>9.0f} KB   recall@{RECALL_K} {store[dtype][f'recall_at_{RECALL_K}']:.3f}")
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the pipeline against local stand-ins.")
+    parser.add_argument("pdfs", nargs="*", help="Design and Access Statement PDFs for extraction and analysis "
+                                                "(default: analyze_das's DAS_PDF_FILENAME, if present)")
+    parser.add_argument("--output", default=BENCHMARK_RESULTS_PATH, help="Where the JSON results are written")
+    parser.add_argument("--compare", help="Earlier results file to compare throughput against")
+    parser.add_argument("--policy-copies", type=int, default=POLICY_COPIES)
+    parser.add_argument("--queries", type=int, default=SEARCH_QUERIES)
+    parser.add_argument("--max-claims", type=int, default=MAX_CLAIMS)
+    parser.add_argument("--renders", type=int, default=REPORT_RENDERS)
+    parser.add_argument("--embed-latency-ms", type=float, default=EMBED_LATENCY_MS)
+    parser.add_argument("--generate-latency-ms", type=float, default=GENERATE_LATENCY_MS)
+    parser.add_argument("--vertex-latency-ms", type=float, default=VERTEX_LATENCY_MS)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stand-in calls that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="Processes used for PDF extraction")
+    args = parser.parse_args()
+    # The chunk, summarise and dedup stages only mean something on a real DAS, never on a generated report
+    if not args.pdfs:
+        if not os.path.exists(analyze_das.default_das_pdf_path()):
+            parser.error(f"no DAS PDFs given and {analyze_das.default_das_pdf_path()} was not found")
+        args.pdfs = [analyze_das.default_das_pdf_path()]
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+
+    print("⏱️ Running offline benchmark...")
+    results = run_benchmark(
+        args.pdfs, policy_copies=args.policy_copies, search_queries=args.queries, max_claims=args.max_claims,
+        report_renders=args.renders, embed_latency_ms=args.embed_latency_ms,
+        generate_latency_ms=args.generate_latency_ms, vertex_latency_ms=args.vertex_latency_ms,
+        error_rate=args.error_rate, seed=args.seed, workers=args.workers
+    )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_results(results, baseline)
+    print(f"\n✅ Results saved to {args.output}")
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# --- Configuration ---
+CHECKPOINT_PATH = ".checkpoints.sqlite"
+CHECKPOINT_BYPASS = os.environ.get("CHECKPOINT_BYPASS") == "1" # Run every stage, never read or write checkpoints
+
+
+def content_hash(*parts):
+    """sha256 over JSON-serialisable parts, e.g. a file hash, settings and an upstream output hash."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def file_hash(path):
+    """sha256 of a file's contents, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CheckpointStore:
+    """Persistent stage outputs and per-item results, keyed by the hash of their inputs.
+
+    A stage row is written only once the stage has finished; items are
+    written one at a time as they finish, so an interrupted stage can resume.
+    """
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS stages ("
+            "key TEXT PRIMARY KEY, pipeline TEXT NOT NULL, stage TEXT NOT NULL, output TEXT NOT NULL, "
+            "files TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "key TEXT NOT NULL, item TEXT NOT NULL, output TEXT NOT NULL, PRIMARY KEY (key, item))"
+        )
+        self.db.commit()
+
+    def get(self, key):
+        """(output, {path: file hash}) of a finished stage, or None."""
+        with self.lock:
+            row = self.db.execute("SELECT output, files FROM stages WHERE key = ?", (key,)).fetchone()
+        return None if row is None else (json.loads(row[0]), json.loads(row[1]))
+
+    def put(self, key, pipeline, stage, output, files):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO stages (key, pipeline, stage, output, files, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, pipeline, stage, json.dumps(output), json.dumps(files), time.time())
+            )
+            # A finished stage no longer needs its partial results
+            self.db.execute("DELETE FROM items WHERE key = ?", (key,))
+            self.db.commit()
+
+    def get_items(self, key):
+        with self.lock:
+            rows = self.db.execute("SELECT item, output FROM items WHERE key = ?", (key,)).fetchall()
+        return {item: json.loads(output) for item, output in rows}
+
+    def put_item(self, key, item, output):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO items (key, item, output) VALUES (?, ?, ?)",
+                            (key, item, json.dumps(output)))
+            self.db.commit()
+
+
+class StageItems:
+    """Finished items of one stage run: get() what an earlier run completed, put() each new result."""
+
+    def __init__(self, store, key, fresh=False):
+        self.store = store
+        self.key = key
+        self.done = {} if store is None or fresh else store.get_items(key)
+
+    def __len__(self):
+        return len(self.done)
+
+    def get(self, item):
+        return self.done.get(item)
+
+    def put(self, item, output):
+        self.done[item] = output
+        if self.store is not None:
+            self.store.put_item(self.key, item, output)
+
+
+class Pipeline:
+    """Runs named stages, reusing a checkpoint when a stage's content-hashed inputs are unchanged.
+
+    Stage inputs should include the hash of each upstream output
+    (output_hash) so a change anywhere recomputes everything after it.
+    fresh=True ignores existing checkpoints but still records new ones.
+    """
+
+    def __init__(self, name, store=None, fresh=False, bypass=CHECKPOINT_BYPASS):
+        self.name = name
+        self.store = None if bypass else store or get_default_store()
+        self.fresh = fresh
+        self.outputs = {}
+
+    def key(self, stage, inputs):
+        return content_hash(self.name, stage, inputs)
+
+    def output_hash(self, stage):
+        """Hash of a stage's output in this run, for use in downstream inputs."""
+        return content_hash(self.outputs[stage])
+
+    def load(self, stage, inputs):
+        """The checkpointed output for these inputs, or None if the stage has to run.
+
+        Files the stage wrote must still exist with the same contents.
+        """
+        found = None if self.store is None or self.fresh else self.store.get(self.key(stage, inputs))
+        if found is None or any(file_hash(path) != digest for path, digest in found[1].items()):
+            return None
+        print(f"⏭️ {self.name}/{stage}: inputs unchanged, reusing checkpoint")
+        self.outputs[stage] = found[0]
+        return found[0]
+
+    def save(self, stage, inputs, output, files=()):
+        self.outputs[stage] = output
+        if self.store is not None:
+            self.store.put(self.key(stage, inputs), self.name, stage, output, {path: file_hash(path) for path in files})
+
+    def run(self, stage, inputs, func, *args, files=()):
+        """func(*args), or its checkpointed output. A None or False result is a failure and is not saved."""
+        output = self.load(stage, inputs)
+        if output is None:
+            output = func(*args)
+            if output is None or output is False:
+                return output
+            self.save(stage, inputs, output, files)
+        return output
+
+    def items(self, stage, inputs):
+        """StageItems for resuming a stage part-way; call save() once the stage has finished."""
+        items = StageItems(self.store, self.key(stage, inputs), self.fresh)
+        if len(items):
+            print(f"⏭️ {self.name}/{stage}: resuming with {len(items)} items finished by an earlier run")
+        return items
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """The process-wide checkpoint store at CHECKPOINT_PATH."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = CheckpointStore()
+        return _default_store
+
+
+def add_arguments(parser):
+    """Adds --fresh to an entry point's argument parser."""
+    parser.add_argument("--fresh", action="store_true",
+                        help="Ignore checkpoints from earlier runs and recompute every stage")
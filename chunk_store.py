@@ -0,0 +1,158 @@
+import os
+import sys
+import mmap
+import json
+import struct
+from collections import namedtuple
+from chunking import load_policy_chunks, policy_code
+
+# --- Configuration ---
+CHUNK_STORE_PATH = "policy_chunks" # Writes policy_chunks.bin (text) and policy_chunks.idx (index)
+
+# Header: magic, version, record count, byte length of the JSON source-document table
+_HEADER = struct.Struct("<4sHII")
+_MAGIC = b"PCHK"
+_VERSION = 1
+# Record: datapoint ID, text offset, text length, page, source-document number, policy code
+_RECORD = struct.Struct("<16sQIIH8s")
+
+ChunkRecord = namedtuple("ChunkRecord", ["id", "page", "policy", "source"])
+
+
+def _id_key(datapoint_id):
+    key = datapoint_id.encode("ascii")
+    if len(key) > 16:
+        raise ValueError(f"Datapoint ID longer than 16 characters: {datapoint_id!r}")
+    return key.ljust(16, b"\0")
+
+
+def write_chunk_store(chunks, path=CHUNK_STORE_PATH):
+    """Writes (id, text, page, policy, source) tuples as a text blob plus a sorted fixed-width index."""
+    sources, records = [], []
+    with open(path + ".bin.tmp", "wb") as blob:
+        offset = 0
+        for datapoint_id, text, page, policy, source in chunks:
+            if source not in sources:
+                sources.append(source)
+            data = text.encode("utf-8")
+            blob.write(data)
+            records.append((_id_key(datapoint_id), offset, len(data), page or 0,
+                            sources.index(source), (policy or "").encode("ascii")[:8]))
+            offset += len(data)
+    records.sort()
+    source_table = json.dumps(sources).encode("utf-8")
+    with open(path + ".idx.tmp", "wb") as index:
+        index.write(_HEADER.pack(_MAGIC, _VERSION, len(records), len(source_table)))
+        index.write(source_table)
+        for record in records:
+            index.write(_RECORD.pack(*record))
+    os.replace(path + ".bin.tmp", path + ".bin")
+    os.replace(path + ".idx.tmp", path + ".idx")
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ChunkStore:
+    """Read-only, memory-mapped chunk store with random access by datapoint ID.
+
+    Opening only reads the header, so startup cost does not grow with the
+    corpus; lookups binary-search the sorted fixed-width index in place.
+    """
+
+    def __init__(self, path=CHUNK_STORE_PATH):
+        self.blob = _map(path + ".bin")
+        self.index = _map(path + ".idx")
+        magic, version, self.count, sources_length = _HEADER.unpack_from(self.index, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path}.idx is not a version {_VERSION} chunk store")
+        self.sources = json.loads(self.index[_HEADER.size:_HEADER.size + sources_length])
+        self.records_start = _HEADER.size + sources_length
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, position):
+        return _RECORD.unpack_from(self.index, self.records_start + position * _RECORD.size)
+
+    def _find(self, datapoint_id):
+        key = _id_key(datapoint_id)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            record = self._record(middle)
+            if record[0] < key:
+                low = middle + 1
+            elif record[0] > key:
+                high = middle
+            else:
+                return record
+        return None
+
+    def __contains__(self, datapoint_id):
+        return self._find(datapoint_id) is not None
+
+    def __getitem__(self, datapoint_id):
+        record = self._find(datapoint_id)
+        if record is None:
+            raise KeyError(datapoint_id)
+        return self.blob[record[1]:record[1] + record[2]].decode("utf-8")
+
+    def get(self, datapoint_id, default=None):
+        try:
+            return self[datapoint_id]
+        except KeyError:
+            return default
+
+    def get_many(self, datapoint_ids):
+        """Bulk fetch; returns texts aligned with datapoint_ids (None where missing)."""
+        return [self.get(datapoint_id) for datapoint_id in datapoint_ids]
+
+    def metadata(self, datapoint_id):
+        record = self._find(datapoint_id)
+        if record is None:
+            raise KeyError(datapoint_id)
+        key, _, _, page, source, policy = record
+        return ChunkRecord(key.rstrip(b"\0").decode("ascii"), page,
+                           policy.rstrip(b"\0").decode("ascii") or None, self.sources[source])
+
+    def location(self, datapoint_id):
+        """(source number, offset, length) of a chunk's text; chunks written back to back are adjacent."""
+        record = self._find(datapoint_id)
+        if record is None:
+            raise KeyError(datapoint_id)
+        return record[4], record[1], record[2]
+
+    def ids(self):
+        for position in range(self.count):
+            yield self._record(position)[0].rstrip(b"\0").decode("ascii")
+
+    def items(self):
+        """(id, text) pairs in the order the chunks were written, i.e. document order."""
+        records = sorted((self._record(position) for position in range(self.count)), key=lambda r: r[1])
+        for key, offset, length, *_ in records:
+            yield key.rstrip(b"\0").decode("ascii"), self.blob[offset:offset + length].decode("utf-8")
+
+
+def convert_json(json_path="policy_chunks.json", path=CHUNK_STORE_PATH):
+    """Converts an existing policy_chunks.json (list or {id: text}) into a chunk store."""
+    chunks = load_policy_chunks(json_path)
+    source = os.path.basename(json_path)
+    write_chunk_store(((i, text, 0, policy_code(text), source) for i, text in chunks.items()), path)
+    print(f"✅ Converted {len(chunks)} chunks from {json_path} to {path}.bin/.idx")
+
+
+def open_chunk_store(path=CHUNK_STORE_PATH, json_path="policy_chunks.json"):
+    """Opens the chunk store, converting policy_chunks.json on first use if needed."""
+    if not os.path.exists(path + ".idx") and os.path.exists(json_path):
+        convert_json(json_path, path)
+    return ChunkStore(path)
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    convert_json(*sys.argv[1:3])
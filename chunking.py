@@ -0,0 +1,208 @@
+import re
+import json
+from collections import namedtuple
+
+# --- Configuration ---
+CHARS_PER_TOKEN = 4 # Rough estimate used for the savings report
+TOC_LEADER_LINES_PER_PAGE = 3 # Pages with this many dot leaders are treated as a table of contents
+
+# Chunks carry their own text, not (start, end) offsets: offsets only mean something against
+# the whole normalised document, and chunk_document streams rather than holding it
+Chunk = namedtuple("Chunk", ["text", "page"])
+
+_WHITESPACE = re.compile(r"\s+")
+_DOT_LEADER = re.compile(r"\.{5,}|(?:\. ){4,}")
+_PAGE_NUMBER = re.compile(r"^\d{1,4}$")
+_SENTENCE_END = re.compile(r"[.!?:;]$")
+_POLICY_HEADING = re.compile(r"^(?:Policy\s+)?[A-Z]{1,3}\d{1,2}\b(?!\.\d)")
+_SENTENCE_BREAK = re.compile(r"[.!?]\s")
+_POLICY_REFERENCE = re.compile(r"\bPolicy\s+([A-Z]{1,3}\d{1,2})\b")
+
+
+def _is_heading(line):
+    """Recognises policy headings such as 'Policy H1 ...' or 'DH2 Heritage assets'."""
+    if line.startswith("Policy "):
+        return bool(_POLICY_HEADING.match(line))
+    return len(line) < 100 and bool(_POLICY_HEADING.match(line))
+
+
+def policy_code(text):
+    """The first policy code (e.g. "H1", "DH2") named in a chunk, or None."""
+    match = _POLICY_REFERENCE.search(text) or _POLICY_HEADING.match(text)
+    if not match:
+        return None
+    return match.group(1) if match.re is _POLICY_REFERENCE else match.group(0).split()[-1]
+
+
+def heading_codes(text):
+    """Policy codes of the explicit "Policy XX" headings inside a chunk, in order (e.g. ["DH1"]).
+
+    Bare codes are not counted: a short line such as "CO2 emissions..." or
+    "C3 dwellinghouses" also looks like one.
+    """
+    codes = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if line.startswith("Policy ") and _is_heading(line):
+            code = policy_code(line)
+            if code and code not in codes:
+                codes.append(code)
+    return codes
+
+
+def _clean_lines(page_text):
+    """Normalises one page into a list of lines, or None for padding/TOC pages."""
+    raw_lines = page_text.split("\n")
+    if sum(1 for line in raw_lines if _DOT_LEADER.search(line)) >= TOC_LEADER_LINES_PER_PAGE:
+        return None
+    lines = []
+    for line in raw_lines:
+        line = _WHITESPACE.sub(" ", line).strip()
+        if _DOT_LEADER.search(line) or _PAGE_NUMBER.match(line):
+            continue
+        # Empty strings are kept as paragraph breaks
+        lines.append(line)
+    return lines
+
+
+def _paragraphs(pages):
+    """Yields (text, page, is_heading) paragraphs from a stream of (page_number, text)."""
+    current, current_page = [], None
+    for page_number, page_text in pages:
+        lines = _clean_lines(page_text)
+        if lines is None:
+            continue
+        for line in lines:
+            # A bare code inside an open paragraph is a wrapped line ("...cut\nCO2 emissions..."), not a heading
+            heading = bool(line) and _is_heading(line) and (not current or line.startswith("Policy "))
+            if current and (not line or heading):
+                yield " ".join(current), current_page, False
+                current = []
+            if heading:
+                yield line, page_number, True
+                continue
+            if not line:
+                continue
+            if not current:
+                current_page = page_number
+            current.append(line)
+            if _SENTENCE_END.search(line):
+                yield " ".join(current), current_page, False
+                current = []
+    if current:
+        yield " ".join(current), current_page, False
+
+
+def _split_long(text, max_chars, first_max=None):
+    """Cuts an over-long paragraph at sentence boundaries, falling back to word boundaries.
+
+    The first piece is at most first_max (default max_chars), leaving room
+    for a heading in front of it. Yields (start, end) offsets into text.
+    """
+    start, end = 0, len(text)
+    limit = first_max or max_chars
+    while end - start > limit:
+        window = text[start:start + limit]
+        breaks = [m.end() for m in _SENTENCE_BREAK.finditer(window) if m.end() > limit // 2]
+        cut = breaks[-1] if breaks else window.rfind(" ") + 1
+        if cut <= 0:
+            cut = limit
+        yield start, start + cut
+        start += cut
+        limit = max_chars
+        while start < end and text[start] == " ":
+            start += 1
+    if start < end:
+        yield start, end
+
+
+class ChunkStats:
+    """Running totals of a chunk_document stream, for report_savings."""
+
+    def __init__(self):
+        self.raw_chars = 0
+        self.chunks = 0
+        self.chunk_chars = 0
+
+
+def chunk_document(pages, max_chars=1000, stats=None):
+    """Splits a stream of (page_number, text) pages into policy-aware chunks.
+
+    Whitespace is normalised, TOC pages and dot leaders are dropped, and a
+    new chunk starts at every policy heading. Paragraphs are packed into
+    chunks of up to max_chars. Yields Chunk(text, page) as each chunk is
+    finished, so only the chunk being built is held, never the whole
+    document; every chunk is needed as text (to embed, store and index)
+    anyway, so the copy is one chunk at a time, not a second document.
+    Pass a ChunkStats to collect totals for report_savings.
+    """
+    stats = stats if stats is not None else ChunkStats()
+
+    def counted(pages):
+        for page_number, page_text in pages:
+            stats.raw_chars += len(page_text)
+            yield page_number, page_text
+
+    def finished(parts, page):
+        text = "".join(parts)
+        stats.chunks += 1
+        stats.chunk_chars += len(text)
+        return Chunk(text, page)
+
+    parts, length, page, has_body = [], 0, None, False
+    for text, paragraph_page, heading in _paragraphs(counted(pages)):
+        previous_end = None
+        first_max = max_chars
+        # The first body text after a heading is split to fit beside it, so the heading never
+        # ends up alone; a long run of headings still gets flushed first
+        if parts and not has_body and not heading and max_chars - length - 1 >= max_chars // 4:
+            first_max = max_chars - length - 1
+        for start, end in _split_long(text, max_chars, first_max):
+            # Paragraphs are joined by a newline; pieces of one paragraph keep the text between them
+            gap = "\n" if previous_end is None else text[previous_end:start]
+            previous_end = end
+            # Runs of headings (e.g. a list of policies) stay together
+            if parts and ((heading and has_body) or length + len(gap) + end - start > max_chars):
+                yield finished(parts, page)
+                parts = []
+            if parts:
+                parts.append(gap)
+                length += len(gap)
+            else:
+                length, page, has_body = 0, paragraph_page, False
+            parts.append(text[start:end])
+            length += end - start
+            has_body = has_body or not heading
+            heading = False
+    if parts:
+        yield finished(parts, page)
+
+
+def report_savings(stats, chunk_size=1000, overlap=200):
+    """Compares the chunker's output, as totalled in a ChunkStats, with the old sliding-window chunk_text."""
+    step = chunk_size - overlap
+    old_chunks = -(-stats.raw_chars // step) if stats.raw_chars else 0
+    old_chars = sum(min(chunk_size, stats.raw_chars - i * step) for i in range(old_chunks))
+    new_chars = stats.chunk_chars
+    old_tokens, new_tokens = old_chars // CHARS_PER_TOKEN, new_chars // CHARS_PER_TOKEN
+    savings = {
+        "old_chunks": old_chunks,
+        "new_chunks": stats.chunks,
+        "old_tokens": old_tokens,
+        "new_tokens": new_tokens,
+        "chunks_saved": old_chunks - stats.chunks,
+        "tokens_saved": old_tokens - new_tokens,
+    }
+    print(f"✅ Text split into {savings['new_chunks']} chunks (~{new_tokens:,} tokens) "
+          f"vs {old_chunks} chunks (~{old_tokens:,} tokens) with a {chunk_size}/{overlap} sliding window: "
+          f"saved {savings['chunks_saved']} chunks and ~{savings['tokens_saved']:,} tokens.")
+    return savings
+
+
+def load_policy_chunks(path="policy_chunks.json"):
+    """Loads {datapoint_id: text}; older list files map positions to IDs "0", "1", ..."""
+    with open(path, "r") as f:
+        chunks = json.load(f)
+    if isinstance(chunks, list):
+        return {str(i): text for i, text in enumerate(chunks)}
+    return chunks
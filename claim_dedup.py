@@ -0,0 +1,59 @@
+import numpy as np
+from embeddings import embed_texts
+
+# --- Configuration ---
+CLAIM_SIMILARITY_THRESHOLD = 0.92 # Cosine similarity at or above which a claim reuses an earlier claim's finding
+CLAIM_EMBEDDING_TASK = "RETRIEVAL_QUERY" # Same task as the search stage, so its embed calls hit the cache
+
+
+class ClaimClusters:
+    """Leader clustering of claim embeddings by cosine similarity.
+
+    Each claim joins the most similar existing cluster if that is at or
+    above the threshold, and otherwise starts a cluster of its own. Adding
+    claims in document order makes the first claim of each cluster its
+    representative, whatever order the pipeline finishes them in.
+    """
+
+    def __init__(self, threshold=CLAIM_SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.keys = []
+        self.vectors = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, vector):
+        """Returns the key of the cluster's representative: key itself if it starts a new cluster."""
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        if self.keys:
+            scores = self.vectors[:len(self.keys)] @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                return self.keys[best]
+        if self.vectors is None:
+            self.vectors = np.zeros((16, len(vector)), dtype=np.float32)
+        elif len(self.keys) == len(self.vectors):
+            # Grow by doubling so adding claims one at a time stays linear
+            self.vectors = np.vstack([self.vectors, np.zeros_like(self.vectors)])
+        self.vectors[len(self.keys)] = vector
+        self.keys.append(key)
+        return key
+
+
+def embed_claims(claims, api_key):
+    """Claim embeddings for clustering, or None if they could not be fetched (claims are then not merged)."""
+    try:
+        return embed_texts(claims, api_key, task_type=CLAIM_EMBEDDING_TASK)
+    except Exception as e:
+        print(f"⚠️ Could not embed claims for de-duplication, analysing each one: {e}")
+        return None
+
+
+def shared_result(result, claim):
+    """A copy of a representative's finding for a member claim, noting whose finding it is.
+
+    Only successful analyses should be shared; errors are not findings.
+    """
+    return {**result, "claim": claim, "shared_with": result["claim"]}
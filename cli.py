@@ -0,0 +1,78 @@
+import argparse
+import tracing
+import checkpoints
+
+# Each command imports the modules it needs when it runs, so `search` never
+# loads PyMuPDF or fpdf2 and `--help` loads nothing at all.
+
+
+def extract_command(args):
+    import extract_text
+    from clients import get_secret
+    print("🔐 Fetching secrets from Google Cloud Secret Manager...")
+    api_key = get_secret(extract_text.GCP_PROJECT_ID, "google-api-key")
+    print("✅ Secrets fetched successfully.")
+    extract_text.run_extract(args.pdf or extract_text.default_pdf_path(), api_key, args.fresh)
+
+
+def upsert_command(args):
+    import extract_text
+    extract_text.run_upsert(extract_text.open_upsert_index(), args.fresh)
+
+
+def search_command(args):
+    import search_index
+    search_index.run_search(args.queries)
+
+
+def analyze_command(args):
+    import analyze_das
+    analyze_das.run_analysis(args.pdfs, args.batch, args.out_dir, args.fresh)
+
+
+def serve_command(args):
+    import query_server
+    # Unset options fall back to query_server's configuration
+    options = {key: value for key, value in (("host", args.host), ("port", args.port)) if value is not None}
+    query_server.serve(socket_path=args.socket, **options)
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    tracing.add_arguments(common)
+    parser = argparse.ArgumentParser(description="Planning objections: index the local plan, search it and analyse DAS PDFs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    extract = commands.add_parser("extract", parents=[common], help="Chunk and embed the local plan PDF")
+    extract.add_argument("--pdf", help="The local plan PDF (default: extract_text.PDF_FILENAME)")
+    checkpoints.add_arguments(extract)
+    extract.set_defaults(func=extract_command)
+
+    upsert = commands.add_parser("upsert", parents=[common], help="Sync the vector index with the embedding file")
+    checkpoints.add_arguments(upsert)
+    upsert.set_defaults(func=upsert_command)
+
+    search = commands.add_parser("search", parents=[common], help="Search the policies for objections")
+    search.add_argument("queries", nargs="+", help="Objections or claims to search for")
+    search.set_defaults(func=search_command)
+
+    analyze = commands.add_parser("analyze", parents=[common], help="Find grounds for objection in DAS PDFs")
+    analyze.add_argument("pdfs", nargs="*", help="DAS PDFs to analyze (default: analyze_das.DAS_PDF_FILENAME)")
+    analyze.add_argument("--batch", help="Folder of DAS PDFs, or a manifest file listing one PDF path per line")
+    analyze.add_argument("--out-dir", default="reports", help="Where batch reports and summary.json are written")
+    checkpoints.add_arguments(analyze)
+    analyze.set_defaults(func=analyze_command)
+
+    serve = commands.add_parser("serve", parents=[common], help="Answer search/analyze requests from a warm process")
+    serve.add_argument("--host", help="Address to listen on (default: query_server.SERVER_HOST)")
+    serve.add_argument("--port", type=int, help="TCP port to listen on (default: query_server.SERVER_PORT)")
+    serve.add_argument("--socket", help="Listen on this Unix socket instead of TCP")
+    serve.set_defaults(func=serve_command)
+    return parser
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    tracing.start(args.trace, args.profile)
+    args.func(args)
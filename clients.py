@@ -0,0 +1,113 @@
+import time
+import threading
+from tracing import span
+
+# --- Configuration ---
+SECRET_TTL_SECONDS = 3600 # Secrets are re-read from Secret Manager after this
+ACCESS_TOKEN_TTL_SECONDS = 3600 # Lifetime of a Google OAuth access token
+ACCESS_TOKEN_REFRESH_MARGIN_SECONDS = 300 # Refresh this long before the token expires
+HTTP_POOL_SIZE = 16 # Keep-alive connections kept per host
+
+# google.generativeai, secretmanager and requests are imported on first use: together they
+# take well over a second to load, which entry points that never call them should not pay
+_lock = threading.Lock()
+_secret_client = None
+_secret_client_lock = threading.Lock()
+_secrets = {}
+_secret_locks = {}
+_access_tokens = {}
+_session = None
+_genai_api_key = None
+_models = {}
+
+
+def _cached_secret(name):
+    with _lock:
+        cached = _secrets.get(name)
+        return cached[0] if cached and cached[1] > time.monotonic() else None
+
+
+def _secret_manager():
+    global _secret_client
+    with _secret_client_lock:
+        if _secret_client is None:
+            from google.cloud import secretmanager
+            _secret_client = secretmanager.SecretManagerServiceClient()
+        return _secret_client
+
+
+def get_secret(project_id, secret_id, version_id="latest"):
+    """Fetches a secret from Google Cloud Secret Manager, cached in memory for SECRET_TTL_SECONDS.
+
+    The RPC runs under a lock for that secret alone: callers wanting the
+    same secret share one fetch, and every other client call carries on.
+    """
+    name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
+    value = _cached_secret(name)
+    if value is not None:
+        return value
+    with _lock:
+        secret_lock = _secret_locks.setdefault(name, threading.Lock())
+    with secret_lock:
+        # Another thread may have fetched it while this one waited
+        value = _cached_secret(name)
+        if value is not None:
+            return value
+        with span("secrets.fetch", secret=secret_id):
+            response = _secret_manager().access_secret_version(request={"name": name})
+        value = response.payload.data.decode("UTF-8")
+        with _lock:
+            _secrets[name] = (value, time.monotonic() + SECRET_TTL_SECONDS)
+        return value
+
+
+def get_access_token(project_id, force_refresh=False):
+    """Returns the gcp-access-token secret, re-reading it shortly before it expires.
+
+    Pass force_refresh=True after a 401 to drop the cached token.
+    """
+    name = f"projects/{project_id}/secrets/gcp-access-token/versions/latest"
+    with _lock:
+        cached = _access_tokens.get(project_id)
+        if cached and not force_refresh and cached[1] > time.monotonic():
+            return cached[0]
+        _secrets.pop(name, None)
+    token = get_secret(project_id, "gcp-access-token")
+    with _lock:
+        _access_tokens[project_id] = (
+            token, time.monotonic() + ACCESS_TOKEN_TTL_SECONDS - ACCESS_TOKEN_REFRESH_MARGIN_SECONDS
+        )
+    return token
+
+
+def http_session():
+    """The process-wide keep-alive session used for Vertex REST calls."""
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def configure_genai(api_key):
+    """Configures the Gemini client once per process (again only if the key changes)."""
+    global _genai_api_key
+    with _lock:
+        if _genai_api_key != api_key:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _genai_api_key = api_key
+
+
+def get_generative_model(model_name):
+    """A shared GenerativeModel per model name, so calls don't rebuild the client."""
+    with _lock:
+        if model_name not in _models:
+            import google.generativeai as genai
+            _models[model_name] = genai.GenerativeModel(model_name)
+        return _models[model_name]
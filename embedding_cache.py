@@ -0,0 +1,142 @@
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+# --- Configuration ---
+EMBEDDING_CACHE_PATH = ".embedding_cache.sqlite"
+EMBEDDING_CACHE_MAX_BYTES = 512 * 1024 * 1024 # Least recently used vectors are evicted beyond this
+TOUCH_FLUSH_ENTRIES = 1000 # Hits whose last_used is held in memory before being written in one commit
+
+
+def cache_key(text, model, task_type):
+    """Content address of an embedding: hash of (text, model, task_type)."""
+    return hashlib.sha256(f"{model}\0{task_type}\0{text}".encode("utf-8")).hexdigest()
+
+
+def as_float32(vector):
+    """A vector rounded to float32, as the cache stores it, so hits and misses return the same values."""
+    return array("f", vector).tolist()
+
+
+class EmbeddingCache:
+    """Persistent, size-bounded LRU cache of float32 embedding vectors.
+
+    Reads only note when each hit was used; the last_used updates are
+    written in one commit every TOUCH_FLUSH_ENTRIES hits, before eviction
+    and at exit. The total vector size is a running count stored in the
+    database, so every process sharing the file sees the same total.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+        # Counted once when the table is new; afterwards every write keeps it up to date
+        self.db.execute("INSERT OR IGNORE INTO cache_size SELECT 0, COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings")
+        self.db.commit()
+        self.touched = {}
+        atexit.register(self.flush)
+
+    def get_many(self, texts, model, task_type):
+        """Returns a list aligned with texts holding a vector or None for each."""
+        keys = [cache_key(text, model, task_type) for text in texts]
+        with self.lock:
+            found = dict(self._select("key, vector", keys))
+            now = time.time()
+            self.touched.update((k, now) for k in found)
+            if len(self.touched) >= TOUCH_FLUSH_ENTRIES:
+                self._write_touches()
+                self.db.commit()
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return [array("f", found[k]).tolist() if k in found else None for k in keys]
+
+    def put_many(self, texts, vectors, model, task_type):
+        """Stores vectors for texts, then evicts the least recently used beyond max_bytes."""
+        now = time.time()
+        # A text repeated in one call is one row, and is counted once
+        vectors = {cache_key(text, model, task_type): array("f", vector).tobytes() for text, vector in zip(texts, vectors)}
+        with self.lock:
+            # Take the write lock first, so no other process changes these rows between the count and the insert
+            self.db.execute("BEGIN IMMEDIATE")
+            replaced = sum(size for _, size in self._select("key, LENGTH(vector)", list(vectors)))
+            self.db.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                                [(key, vector, now) for key, vector in vectors.items()])
+            self._add_bytes(sum(len(vector) for vector in vectors.values()) - replaced)
+            self._write_touches()
+            self._evict()
+            self.db.commit()
+
+    def flush(self):
+        """Writes the last_used times of hits not yet saved."""
+        with self.lock:
+            if self.touched:
+                self._write_touches()
+                self.db.commit()
+
+    def _select(self, columns, keys):
+        rows = []
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            rows.extend(self.db.execute(
+                f"SELECT {columns} FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+            ))
+        return rows
+
+    def _write_touches(self):
+        self.db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                            [(now, key) for key, now in self.touched.items()])
+        self.touched = {}
+
+    def _add_bytes(self, delta):
+        self.db.execute("UPDATE cache_size SET bytes = bytes + ? WHERE id = 0", (delta,))
+
+    def _total_bytes(self):
+        return self.db.execute("SELECT bytes FROM cache_size WHERE id = 0").fetchone()[0]
+
+    def _evict(self):
+        total = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        stale, removed = [], 0
+        for key, size in self.db.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used"):
+            if total - removed <= self.max_bytes:
+                break
+            stale.append((key,))
+            removed += size
+        self.db.executemany("DELETE FROM embeddings WHERE key = ?", stale)
+        self._add_bytes(-removed)
+
+    def stats(self):
+        """Hit/miss counters for this process plus the on-disk size."""
+        with self.lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            size = self._total_bytes()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """The process-wide cache at EMBEDDING_CACHE_PATH, shared by all scripts."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
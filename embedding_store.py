@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import numpy as np
+from tracing import span
+
+# --- Configuration ---
+EMBEDDING_STORE_PATH = "policy_embeddings.emb"
+EMBEDDING_STORE_DTYPE = os.environ.get("EMBEDDING_STORE_DTYPE", "float16") # "float32", "float16" or "int8"
+WRITE_BLOCK_ROWS = 4096 # Vectors converted and written per block
+SCORE_BLOCK_ROWS = 65536 # Rows dequantized and scored per block, bounding peak memory
+RECALL_SAMPLE_QUERIES = 200 # Stored vectors used as queries in the recall check
+RECALL_K = 10 # Neighbors compared per query in the recall check
+
+# Header: magic, version, dtype code, rows, dimensions, metadata bytes
+_HEADER = struct.Struct("<4sHB1xIII")
+_MAGIC = b"PEMB"
+_VERSION = 1
+_DTYPES = ("float32", "float16", "int8")
+_ALIGN = 64
+
+
+def _align(offset):
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def quantize(vectors, dtype):
+    """Converts a float32 block to the stored dtype, returning (stored, per-row scales or None).
+
+    int8 uses symmetric per-row scaling: row * scale recovers the vector.
+    """
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors.astype(dtype), None
+
+
+def write_embeddings(path, ids, vectors, dtype=EMBEDDING_STORE_DTYPE, **metadata):
+    """Writes vectors with their datapoint IDs and metadata (model, task_type...) to path.
+
+    Layout after the header: metadata JSON, 16-byte IDs, the row-major
+    vector matrix and, for int8, one float32 scale per row, each section
+    64-byte aligned. Vectors are converted a block at a time, so an
+    iterator of rows is never held as one float32 matrix.
+    """
+    if dtype not in _DTYPES:
+        raise ValueError(f"Unknown embedding dtype: {dtype!r}")
+    ids = list(ids)
+    vectors = iter(vectors)
+    first = np.asarray(next(vectors, []), dtype=np.float32)
+    dims = len(first) if ids else 0
+    meta = json.dumps({"dtype": dtype, "created": time.time(), **metadata}).encode("utf-8")
+    scales = []
+    with span("embeddings.write", items=len(ids), dtype=dtype), open(path + ".tmp", "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, _DTYPES.index(dtype), len(ids), dims, len(meta)))
+        f.write(meta)
+        f.write(b"\0" * (_align(f.tell()) - f.tell()))
+        f.write(b"".join(i.encode("ascii").ljust(16, b"\0") for i in ids))
+        f.write(b"\0" * (_align(f.tell()) - f.tell()))
+        block, written = [first], 0
+        for vector in vectors:
+            if len(block) == WRITE_BLOCK_ROWS:
+                written += _write_block(f, block, dtype, scales)
+                block = []
+            block.append(vector)
+        if ids:
+            written += _write_block(f, block, dtype, scales)
+        if written != len(ids):
+            raise ValueError(f"Got {written} vectors for {len(ids)} IDs")
+        if scales:
+            f.write(np.concatenate(scales).tobytes())
+    os.replace(path + ".tmp", path)
+    return len(ids)
+
+
+def _write_block(f, block, dtype, scales):
+    stored, block_scales = quantize(np.asarray(block, dtype=np.float32), dtype)
+    f.write(stored.tobytes())
+    if block_scales is not None:
+        scales.append(block_scales)
+    return len(stored)
+
+
+class EmbeddingFile:
+    """Memory-mapped embedding file written by write_embeddings.
+
+    Vectors stay in their stored dtype on disk; block(), rows() and
+    indexing return float32 copies of just the rows asked for.
+    """
+
+    def __init__(self, path=EMBEDDING_STORE_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, dtype_code, self.count, self.dims, meta_bytes = _HEADER.unpack_from(self.data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a version {_VERSION} embedding file")
+        self.dtype = _DTYPES[dtype_code]
+        self.metadata = json.loads(self.data[_HEADER.size:_HEADER.size + meta_bytes])
+        offset = _align(_HEADER.size + meta_bytes)
+        self.ids = np.frombuffer(self.data, dtype="S16", count=self.count, offset=offset)
+        offset = _align(offset + self.ids.nbytes)
+        self.matrix = np.frombuffer(
+            self.data, dtype=self.dtype, count=self.count * self.dims, offset=offset
+        ).reshape(self.count, self.dims)
+        self.scales = None
+        if self.dtype == "int8":
+            self.scales = np.frombuffer(self.data, dtype=np.float32, count=self.count, offset=offset + self.matrix.nbytes)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, row):
+        return self.rows([row])[0]
+
+    def id_list(self):
+        return [i.decode("ascii") for i in self.ids]
+
+    def rows(self, rows):
+        """float32 vectors for the given row numbers."""
+        vectors = self.matrix[rows].astype(np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][:, None]
+        return vectors
+
+    def block(self, start, end):
+        """float32 vectors for rows start..end."""
+        return self.rows(slice(start, end))
+
+    def search(self, queries, k=RECALL_K):
+        """(rows, scores) of the k best dot-product matches per query, best first."""
+        return search_blocks(queries, self.block, self.count, k)
+
+
+def top_k(scores, k):
+    """Column indices of the k largest scores in each row, best first."""
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def search_blocks(queries, block, count, k):
+    """Exact top-k over count rows fetched as float32 by block(start, end), one block at a time."""
+    queries = np.asarray(queries, dtype=np.float32)
+    best_rows = best_scores = None
+    for start in range(0, count, SCORE_BLOCK_ROWS):
+        scores = queries @ block(start, start + SCORE_BLOCK_ROWS).T
+        rows = top_k(scores, k)
+        block_scores = np.take_along_axis(scores, rows, axis=1)
+        rows += start
+        if best_rows is not None:
+            block_scores = np.hstack([best_scores, block_scores])
+            rows = np.hstack([best_rows, rows])
+        keep = top_k(block_scores, k)
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+        best_scores = np.take_along_axis(block_scores, keep, axis=1)
+    return best_rows, best_scores
+
+
+def recall_check(reference, store, sample=RECALL_SAMPLE_QUERIES, k=RECALL_K, seed=0):
+    """Mean recall@k of searching store against exact search over the float32 reference vectors.
+
+    Queries are a random sample of the reference vectors themselves.
+    """
+    reference = np.asarray(reference, dtype=np.float32)
+    if not len(reference):
+        return 1.0
+    rng = np.random.default_rng(seed)
+    queries = reference[rng.choice(len(reference), min(sample, len(reference)), replace=False)]
+    exact, _ = search_blocks(queries, lambda start, end: reference[start:end], len(reference), k)
+    approx, _ = store.search(queries, k)
+    return float(np.mean([len(set(e) & set(a)) / len(e) for e, a in zip(exact, approx)]))
+
+
+def report_store(store, reference):
+    """Prints the file size against float32 and JSON text, and recall against the float32 vectors."""
+    size = os.path.getsize(store.path)
+    float32_bytes = store.count * store.dims * 4
+    # Vectors as json.dumps writes them today, estimated from the first 100
+    sample = np.asarray(reference[:100], dtype=np.float32).tolist()
+    json_bytes = len(json.dumps(sample)) * store.count / max(1, len(sample))
+    print(f"✅ Saved {store.count} {store.dtype} embeddings to {store.path}: {size / 1024:.0f} KB, "
+          f"{float32_bytes / max(1, store.matrix.nbytes):.1f}x smaller than float32 "
+          f"and {json_bytes / max(1, size):.1f}x smaller than JSON text")
+    if store.dtype != "float32":
+        print(f"✅ Recall@{RECALL_K} against float32 on {min(RECALL_SAMPLE_QUERIES, store.count)} "
+              f"sample queries: {recall_check(reference, store):.3f}")
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    # python embedding_store.py SOURCE.emb [float16|int8 ...]: re-encodes a float32 file and checks recall
+    source = EmbeddingFile(sys.argv[1] if len(sys.argv) > 1 else EMBEDDING_STORE_PATH)
+    print(f"📦 {source.path}: {source.count} x {source.dims} {source.dtype}, {source.metadata}")
+    reference = source.block(0, source.count)
+    for dtype in sys.argv[2:] or ["float16", "int8"]:
+        target = f"{os.path.splitext(source.path)[0]}.{dtype}.emb"
+        write_embeddings(target, source.id_list(), reference, dtype,
+                         **{key: value for key, value in source.metadata.items() if key not in ("dtype", "created")})
+        report_store(EmbeddingFile(target), reference)
@@ -0,0 +1,188 @@
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from embedding_cache import get_default_cache, as_float32
+from clients import configure_genai
+from tracing import span, annotate, submit
+
+# --- Configuration ---
+EMBEDDING_MODEL = "models/text-embedding-004"
+MAX_BATCH_SIZE = 100 # batchEmbedContents accepts at most 100 texts per request
+MAX_BATCH_CHARS = 200_000 # Keeps request bodies well under the API payload limit
+MAX_CONCURRENCY = 4 # Batches in flight at once
+MAX_ROUNDS = 6 # Attempts per batch before giving up
+MIN_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+
+# Exception class names (matched anywhere in the MRO) from google.api_core, requests and the standard library
+_TRANSIENT_ERRORS = {"ServerError", "ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "Aborted",
+                     "ConnectionError", "Timeout", "TimeoutError", "ChunkedEncodingError"}
+_PERMANENT_ERRORS = {"ClientError", "InvalidArgument", "BadRequest", "PermissionDenied", "Forbidden",
+                     "Unauthenticated", "Unauthorized", "NotFound", "FailedPrecondition"}
+_CLIENT_STATUS = re.compile(r"^4\d\d\b")
+
+
+def _is_quota_error(error):
+    """True for 429 / RESOURCE_EXHAUSTED responses from the Gemini API."""
+    text = str(error).lower()
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests") or "429" in text or "quota" in text
+
+
+def _is_retryable(error):
+    """True for quota, 5xx and network errors; False for other 4xx responses, which fail the same way every time."""
+    if _is_quota_error(error):
+        return True
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & _PERMANENT_ERRORS:
+        return False
+    if names & _TRANSIENT_ERRORS:
+        return True
+    # google.api_core errors read "<status> <message>"; anything unrecognised is retried
+    return not _CLIENT_STATUS.match(str(error))
+
+
+def _round_delay(attempt):
+    """Pause before retry round attempt (1, 2, ...): doubles from MIN_BACKOFF_SECONDS up to MAX_BACKOFF_SECONDS."""
+    return min(MAX_BACKOFF_SECONDS, MIN_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+
+class _Backoff:
+    """Shared delay that doubles on quota errors and decays on success."""
+
+    def __init__(self):
+        self.delay = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            delay = self.delay
+        if delay:
+            time.sleep(delay)
+
+    def throttled(self):
+        with self.lock:
+            self.delay = min(MAX_BACKOFF_SECONDS, max(MIN_BACKOFF_SECONDS, self.delay * 2))
+
+    def succeeded(self):
+        with self.lock:
+            self.delay = self.delay / 2 if self.delay > MIN_BACKOFF_SECONDS / 4 else 0.0
+
+
+def _batches(texts, batch_size, max_chars):
+    """Splits texts into (start, end) ranges within the count and size limits."""
+    start = size = 0
+    for i, text in enumerate(texts):
+        if i > start and (i - start >= batch_size or size + len(text) > max_chars):
+            yield start, i
+            start, size = i, 0
+        size += len(text)
+    if start < len(texts):
+        yield start, len(texts)
+
+
+def _embed_batch(batch, model, task_type, backoff):
+    import google.generativeai as genai
+    backoff.wait()
+    with span("gemini.embed", items=len(batch), request_bytes=sum(len(t.encode("utf-8")) for t in batch)):
+        try:
+            result = genai.embed_content(model=model, content=batch, task_type=task_type)
+        except Exception as e:
+            if _is_quota_error(e):
+                backoff.throttled()
+            raise
+    backoff.succeeded()
+    return result['embedding']
+
+
+def _embed_uncached(texts, task_type, model, batch_size, max_concurrency, on_batch=None):
+    """Embeds texts in API-sized batches, returning vectors in input order.
+
+    on_batch(start, end, vectors) is called as each batch completes, so its
+    vectors can be saved even if a later batch fails or the run stops.
+
+    Batches run concurrently; quota errors slow every worker down through a
+    shared backoff, and only the batches that failed are retried, after a
+    pause that doubles each round. A non-retryable error (e.g. a 400) is
+    raised at once rather than retried.
+    """
+    embeddings = [None] * len(texts)
+    pending = list(_batches(texts, batch_size, MAX_BATCH_CHARS))
+    backoff = _Backoff()
+    retried = 0
+    started = time.perf_counter()
+
+    for attempt in range(MAX_ROUNDS):
+        if not pending:
+            break
+        if attempt:
+            retried += len(pending)
+            delay = _round_delay(attempt)
+            print(f"⚠️ Retrying {len(pending)} failed embedding batches in {delay:.0f}s "
+                  f"(attempt {attempt + 1}/{MAX_ROUNDS})...")
+            time.sleep(delay)
+        failed, last_error = [], None
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            futures = {submit(pool, _embed_batch, texts[s:e], model, task_type, backoff): (s, e) for s, e in pending}
+            for future in as_completed(futures):
+                s, e = futures[future]
+                try:
+                    embeddings[s:e] = future.result()
+                except Exception as error:
+                    if not _is_retryable(error):
+                        for queued in futures:
+                            queued.cancel()
+                        raise
+                    failed.append((s, e))
+                    last_error = error
+                    continue
+                if on_batch is not None:
+                    on_batch(s, e, embeddings[s:e])
+        pending = sorted(failed)
+    if pending:
+        raise RuntimeError(f"{len(pending)} embedding batches still failing after {MAX_ROUNDS} attempts: {last_error}")
+
+    annotate(retries=retried)
+    elapsed = time.perf_counter() - started
+    rate = len(texts) / elapsed if elapsed else float("inf")
+    print(f"✅ Embedded {len(texts)} texts in {elapsed:.1f}s ({rate:.1f} chunks/sec, {retried} batch retries).")
+    return embeddings
+
+
+def embed_texts(texts, api_key, task_type="RETRIEVAL_DOCUMENT", model=EMBEDDING_MODEL,
+                batch_size=MAX_BATCH_SIZE, max_concurrency=MAX_CONCURRENCY, use_cache=True):
+    """Embeds any number of texts, returning vectors in input order.
+
+    Vectors already in the shared on-disk cache are reused, so only new or
+    changed texts cost an API call. Vectors are rounded to float32 whether
+    or not they came from the cache.
+    """
+    texts = list(texts)
+    if not use_cache:
+        configure_genai(api_key)
+        with span("embed.texts", items=len(texts), cache_misses=len(texts)):
+            return [as_float32(v) for v in _embed_uncached(texts, task_type, model, batch_size, max_concurrency)]
+
+    cache = get_default_cache()
+    with span("embed.texts", items=len(texts)) as attributes:
+        embeddings = cache.get_many(texts, model, task_type)
+        missing = [i for i, vector in enumerate(embeddings) if vector is None]
+        attributes.update(cache_hits=len(texts) - len(missing), cache_misses=len(missing))
+        if missing:
+            configure_genai(api_key)
+            # Identical texts in one call only need embedding once
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = {}
+
+            def save_batch(start, end, vectors):
+                # Cached as each batch lands, so an interrupted or failed call keeps what it embedded
+                vectors = [as_float32(v) for v in vectors]
+                fresh.update(zip(unique[start:end], vectors))
+                cache.put_many(unique[start:end], vectors, model, task_type)
+
+            _embed_uncached(unique, task_type, model, batch_size, max_concurrency, on_batch=save_batch)
+            for i in missing:
+                embeddings[i] = fresh[texts[i]]
+    if len(texts) > 1:
+        print(f"✅ Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses.")
+    return embeddings
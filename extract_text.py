@@ -1,119 +1,154 @@
-import fitz
 import os
-import google.generativeai as genai
-import requests
-import json
-from google.cloud import secretmanager
+import argparse
+import functools
+import tracing
+import checkpoints
+from clients import get_secret, get_access_token
+from pdf_text import iter_pdf_pages
+from chunking import chunk_document, ChunkStats, report_savings, load_policy_chunks, policy_code
+from chunk_store import write_chunk_store, CHUNK_STORE_PATH
+from lexical_index import write_lexical_index, LEXICAL_INDEX_PATH
+from embeddings import embed_texts, EMBEDDING_MODEL
+from embedding_store import write_embeddings, EmbeddingFile, report_store, EMBEDDING_STORE_PATH, EMBEDDING_STORE_DTYPE
+from vector_index import get_vector_index, VECTOR_INDEX_BACKEND
+from index_sync import chunk_id, sync_index, save_manifest
 
 # --- Configuration ---
 GCP_PROJECT_ID = "crucial-accord-467816-g0"
 INDEX_ID = "8241710463390318592" # The ID of your INDEX
 GCP_LOCATION = "europe-west2" # This line is needed
 PDF_FILENAME = "islington-council-local-plan-strategic-and-development-management-policies.pdf"
+EXTRACT_WORKERS = os.cpu_count() or 1 # Processes used for PyMuPDF page extraction
+MANIFEST_PATH = f"index_manifest_{VECTOR_INDEX_BACKEND}.json" # What is already in each backend's index
+CHUNK_MAX_CHARS = 1000 # Chunk size; changing it invalidates the chunk checkpoint and everything after it
 
-def get_secret(project_id, secret_id, version_id="latest"):
-    """Fetches a secret from Google Cloud Secret Manager."""
-    client = secretmanager.SecretManagerServiceClient()
-    name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
-    response = client.access_secret_version(request={"name": name})
-    return response.payload.data.decode("UTF-8")
-
-def extract_text_from_pdf(full_pdf_path):
-    # This function remains the same
+def chunk_policy_pdf(pdf_path):
+    """Extracts and chunks the plan; returns {"texts", "pages"} or None on failure."""
     try:
-        doc = fitz.open(full_pdf_path)
-        print(f"✅ Successfully opened '{os.path.basename(full_pdf_path)}'. Pages: {doc.page_count}")
-        full_text = "".join(page.get_text("text") for page in doc)
-        doc.close()
-        print("✅ Text extraction complete.")
-        return full_text
+        stats = ChunkStats()
+        chunks = {"texts": [], "pages": []}
+        for chunk in chunk_document(iter_pdf_pages(pdf_path, workers=EXTRACT_WORKERS), CHUNK_MAX_CHARS, stats):
+            chunks["texts"].append(chunk.text)
+            chunks["pages"].append(chunk.page)
+        report_savings(stats, chunk_size=CHUNK_MAX_CHARS, overlap=200)
+        return chunks
     except Exception as e:
         print(f"❌ Error processing PDF file: {e}")
         return None
 
-def chunk_text(text, chunk_size=1000, overlap=200):
-    # This function remains the same
-    if not text: return []
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start += chunk_size - overlap
-    print(f"✅ Text split into {len(chunks)} chunks.")
-    return chunks
+def save_chunks(chunk_ids, text_chunks, pages):
+    """Writes the chunk store and lexical index; they only depend on the chunks, not the upsert."""
+    write_chunk_store(
+        (i, text, page, policy_code(text), PDF_FILENAME) for i, text, page in zip(chunk_ids, text_chunks, pages)
+    )
+    print(f"✅ Saved text chunks to {CHUNK_STORE_PATH}.bin/.idx")
+    write_lexical_index(zip(chunk_ids, text_chunks))
+    print(f"✅ Saved lexical index to {LEXICAL_INDEX_PATH}")
+    return True
 
 def generate_embeddings(chunks_to_embed, api_key):
-    # This function remains the same
+    """Embeds every chunk through the batched, rate-limit-aware scheduler."""
     print("\n--- Generating Embeddings ---")
     try:
-        genai.configure(api_key=api_key)
-        result = genai.embed_content(
-            model="models/text-embedding-004",
-            content=chunks_to_embed,
-            task_type="RETRIEVAL_DOCUMENT"
-        )
-        print(f"✅ Successfully generated {len(result['embedding'])} embeddings.")
-        return result['embedding']
+        embeddings = embed_texts(chunks_to_embed, api_key, task_type="RETRIEVAL_DOCUMENT")
+        print(f"✅ Successfully generated {len(embeddings)} embeddings.")
+        return embeddings
     except Exception as e:
         print(f"❌ Error generating embeddings: {e}")
         return None
 
-def upsert_via_rest(embeddings, access_token):
-    """Saves the embeddings to Vector Search using a direct REST API call."""
-    print("\n--- Upserting to Vector Search (Direct API Call) ---")
-
-    # Correct URL targets the 'indexes' path
-    endpoint_url = f"https://{GCP_LOCATION}-aiplatform.googleapis.com/v1/projects/{GCP_PROJECT_ID}/locations/{GCP_LOCATION}/indexes/{INDEX_ID}:upsertDatapoints"
+def embed_to_store(chunk_ids, text_chunks, api_key):
+    """Embeds the chunks into the compact embedding file; returns its hash, or None on failure.
 
-    datapoints = [{"datapointId": str(i), "featureVector": embedding} for i, embedding in enumerate(embeddings)]
-    request_body = {"datapoints": datapoints}
-
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+    Batches already embedded by an interrupted run come from the embedding cache.
+    """
+    embeddings = generate_embeddings(text_chunks, api_key)
+    if not embeddings:
+        return None
+    write_embeddings(EMBEDDING_STORE_PATH, chunk_ids, embeddings, EMBEDDING_STORE_DTYPE,
+                     model=EMBEDDING_MODEL, task_type="RETRIEVAL_DOCUMENT")
+    report_store(EmbeddingFile(EMBEDDING_STORE_PATH), embeddings)
+    return {"path": EMBEDDING_STORE_PATH, "sha256": checkpoints.file_hash(EMBEDDING_STORE_PATH)}
 
-    response = requests.post(endpoint_url, headers=headers, data=json.dumps(request_body))
+def upsert_embeddings(chunk_ids, embeddings, index):
+    """Sends only new, changed and removed datapoints to the configured vector index backend."""
+    print("\n--- Upserting to Vector Search ---")
 
-    if response.status_code == 200:
+    try:
+        sync_index(index, chunk_ids, embeddings, MANIFEST_PATH)
         print("✅ Successfully upserted datapoints.")
-    else:
+        return True
+    except Exception as e:
         print(f"❌ Error upserting to Vector Search:")
-        print(f"Status Code: {response.status_code}")
-        print(f"Response: {response.text}")
+        print(e)
+        return False
+
+def default_pdf_path():
+    try:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        return os.path.join(script_dir, '..', 'data sources for Islington', PDF_FILENAME)
+    except NameError:
+        return os.path.join('..', 'data sources for Islington', PDF_FILENAME)
+
+def open_upsert_index():
+    """The configured vector index backend, set up for upserts."""
+    # The local backend runs offline and needs no access token
+    access_token = functools.partial(get_access_token, GCP_PROJECT_ID) if VECTOR_INDEX_BACKEND == "vertex" else None
+    return get_vector_index(access_token=access_token, project_id=GCP_PROJECT_ID, location=GCP_LOCATION, index_id=INDEX_ID)
+
+def run_extract(pdf_path, api_key, fresh=False):
+    """Runs the chunk -> store -> embed stages; returns True once the embedding file matches the PDF.
+
+    Each stage is skipped when its inputs match the last successful run.
+    """
+    if not os.path.exists(pdf_path):
+        print(f"❌ Error: The file was not found at the expected path: {pdf_path}")
+        return False
+    pipeline = checkpoints.Pipeline("extract", fresh=fresh)
+    chunked = pipeline.run("chunk", [checkpoints.file_hash(pdf_path), CHUNK_MAX_CHARS], chunk_policy_pdf, pdf_path)
+    if not chunked or not chunked["texts"]:
+        return False
+
+    text_chunks = chunked["texts"]
+    chunk_ids = [chunk_id(text) for text in text_chunks]
+    pipeline.run("store", [pipeline.output_hash("chunk")], save_chunks, chunk_ids, text_chunks,
+                 chunked["pages"], files=[CHUNK_STORE_PATH + ".bin", CHUNK_STORE_PATH + ".idx", LEXICAL_INDEX_PATH])
+    embedded = pipeline.run(
+        "embed", [pipeline.output_hash("chunk"), EMBEDDING_MODEL, EMBEDDING_STORE_DTYPE],
+        embed_to_store, chunk_ids, text_chunks, api_key, files=[EMBEDDING_STORE_PATH]
+    )
+    return bool(embedded)
+
+def run_upsert(index, fresh=False):
+    """Syncs the index with the embedding file, streaming the datapoints from it."""
+    if not os.path.exists(EMBEDDING_STORE_PATH):
+        print(f"❌ Error: {EMBEDDING_STORE_PATH} not found. Please run the extract step first.")
+        return False
+    # Older runs used positional IDs; list them in the manifest so they get removed
+    if not os.path.exists(MANIFEST_PATH) and os.path.exists("policy_chunks.json"):
+        save_manifest({i: None for i in load_policy_chunks("policy_chunks.json") if i.isdigit()}, MANIFEST_PATH)
+    embeddings = EmbeddingFile(EMBEDDING_STORE_PATH)
+    pipeline = checkpoints.Pipeline("extract", fresh=fresh)
+    return pipeline.run(
+        "upsert", [checkpoints.file_hash(EMBEDDING_STORE_PATH), VECTOR_INDEX_BACKEND, INDEX_ID],
+        upsert_embeddings, embeddings.id_list(), embeddings, index, files=[MANIFEST_PATH]
+    )
 
 # --- Main Execution Block ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk, embed and index the local plan PDF.")
+    parser.add_argument("--pdf", help=f"The local plan PDF (default: ../data sources for Islington/{PDF_FILENAME})")
+    tracing.add_arguments(parser)
+    checkpoints.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.start(args.trace, args.profile)
+
     # Fetch secrets
     print("🔐 Fetching secrets from Google Cloud Secret Manager...")
     GOOGLE_API_KEY = get_secret(GCP_PROJECT_ID, "google-api-key")
-    ACCESS_TOKEN = get_secret(GCP_PROJECT_ID, "gcp-access-token")
+    index = open_upsert_index()
     print("✅ Secrets fetched successfully.")
 
-    # Define file path
-    try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        pdf_path = os.path.join(script_dir, '..', 'data sources for Islington', PDF_FILENAME)
-    except NameError:
-        pdf_path = os.path.join('..', 'data sources for Islington', PDF_FILENAME)
-
-    # Run the main logic
-    if os.path.exists(pdf_path):
-        MAX_CHUNKS_TO_PROCESS = 50
-        policy_text = extract_text_from_pdf(pdf_path)
-
-        if policy_text:
-            text_chunks = chunk_text(policy_text)[:MAX_CHUNKS_TO_PROCESS]
-
-            if text_chunks:
-                embeddings_result = generate_embeddings(text_chunks, GOOGLE_API_KEY)
-                if embeddings_result:
-                    upsert_via_rest(embeddings_result, ACCESS_TOKEN)
-
-                    # Save the chunks to a file after a successful upsert
-                    with open("policy_chunks.json", "w") as f:
-                        json.dump(text_chunks, f)
-                    print("✅ Saved text chunks to policy_chunks.json")
-    else:
-        print(f"❌ Error: The file was not found at the expected path: {pdf_path}")
\ No newline at end of file
+    # Run the main logic: each stage is skipped when its inputs match the last successful run
+    if run_extract(args.pdf or default_pdf_path(), GOOGLE_API_KEY, args.fresh):
+        run_upsert(index, args.fresh)
@@ -0,0 +1,69 @@
+import os
+import json
+import hashlib
+from array import array
+from tracing import span
+
+# --- Configuration ---
+INDEX_MANIFEST_PATH = "index_manifest.json"
+SYNC_CHECKPOINT_ITEMS = 10000 # The manifest is saved after each slice of this many upserts
+
+
+def chunk_id(text):
+    """Stable datapoint ID derived from chunk content."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def vector_fingerprint(vector):
+    """Short hash of a vector's float32 bytes, used to spot re-embedded chunks."""
+    return hashlib.sha256(array("f", vector).tobytes()).hexdigest()[:16]
+
+
+def load_manifest(manifest_path=INDEX_MANIFEST_PATH):
+    """Returns {datapoint_id: vector_fingerprint} for what is already in the index."""
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, manifest_path=INDEX_MANIFEST_PATH):
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def sync_index(index, ids, vectors, manifest_path=INDEX_MANIFEST_PATH):
+    """Brings the index in line with (ids, vectors), sending only the differences.
+
+    vectors is a list or an EmbeddingFile; changed rows are read from it
+    again as they are upserted rather than kept alongside the fingerprints.
+    New or re-embedded datapoints are upserted, IDs in the manifest that are
+    no longer present are removed, and the manifest is updated after each
+    step (and each slice of a large upsert) succeeds, so an interrupted sync
+    resumes where it stopped.
+    """
+    manifest = load_manifest(manifest_path)
+    wanted = {}
+    for row, datapoint_id in enumerate(ids):
+        wanted[datapoint_id] = (row, vector_fingerprint(vectors[row]))
+
+    changed = [i for i, (_, fingerprint) in wanted.items() if manifest.get(i) != fingerprint]
+    stale = [i for i in manifest if i not in wanted]
+    print(f"✅ Index diff: {len(changed)} to upsert, {len(stale)} to remove, "
+          f"{len(wanted) - len(changed)} unchanged.")
+
+    if changed:
+        with span("index.upsert", items=len(changed)):
+            for start in range(0, len(changed), SYNC_CHECKPOINT_ITEMS):
+                batch = changed[start:start + SYNC_CHECKPOINT_ITEMS]
+                index.upsert(batch, (vectors[wanted[i][0]] for i in batch))
+                manifest.update((i, wanted[i][1]) for i in batch)
+                save_manifest(manifest, manifest_path)
+    if stale:
+        with span("index.remove", items=len(stale)):
+            index.remove(stale)
+        for i in stale:
+            del manifest[i]
+        save_manifest(manifest, manifest_path)
+    return {"upserted": len(changed), "removed": len(stale), "unchanged": len(wanted) - len(changed)}
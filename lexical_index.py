@@ -0,0 +1,225 @@
+import os
+import re
+import sys
+import json
+import mmap
+import struct
+from collections import Counter, defaultdict
+import numpy as np
+from chunking import heading_codes, load_policy_chunks
+from chunk_store import ChunkStore, CHUNK_STORE_PATH
+from vector_index import Neighbor
+from tracing import span
+
+# --- Configuration ---
+LEXICAL_INDEX_PATH = "policy_lexical.idx"
+BM25_K1 = 1.2 # Term-frequency saturation
+BM25_B = 0.75 # Document-length normalisation
+
+# Header: magic, version, docs, terms, postings, term blob bytes, code table bytes, average doc length
+_HEADER = struct.Struct("<4sH2xIIIIIf")
+_MAGIC = b"PLEX"
+_VERSION = 2 # 2: the code table only holds explicit "Policy XX" headings
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_CODE = re.compile(r"\b[A-Z]{1,3}\d{1,2}\b")
+_STOPWORDS = frozenset(
+    "a an and are as at be been by for from has have in is it its of on or that the their this to was "
+    "were which will with would should not no can may any all also such".split()
+)
+
+
+def tokenize(text):
+    """Lower-cased word tokens without stopwords, with plurals folded ("homes" -> "home")."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith("ies"):
+            token = token[:-3] + "y"
+        elif len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def write_lexical_index(chunks, path=LEXICAL_INDEX_PATH):
+    """Builds BM25 postings and a policy-code table for (id, text) pairs in document order.
+
+    The code table maps each policy code to the chunks with an explicit
+    "Policy XX" heading for it, the policy's own section first and long
+    policy lists last.
+    """
+    ids, lengths = [], []
+    postings = defaultdict(list)
+    code_candidates = defaultdict(list)
+    for doc, (datapoint_id, text) in enumerate(chunks):
+        ids.append(datapoint_id.encode("ascii").ljust(16, b"\0"))
+        counts = Counter(tokenize(text))
+        lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings[term].append((doc, min(tf, 65535)))
+        codes = heading_codes(text)
+        for position, code in enumerate(codes):
+            code_candidates[code].append((position, len(codes), doc))
+    code_table = {code: [doc for _, _, doc in sorted(entries)] for code, entries in code_candidates.items()}
+
+    terms = sorted(postings, key=lambda t: t.encode("utf-8"))
+    term_blob = b"".join(t.encode("utf-8") for t in terms)
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.uint32)
+    np.cumsum([len(t.encode("utf-8")) for t in terms], out=term_offsets[1:])
+    posting_offsets = np.zeros(len(terms) + 1, dtype=np.uint32)
+    np.cumsum([len(postings[t]) for t in terms], out=posting_offsets[1:])
+    flat = [entry for t in terms for entry in postings[t]]
+    posting_docs = np.array([doc for doc, _ in flat], dtype=np.uint32)
+    posting_tfs = np.array([tf for _, tf in flat], dtype=np.uint16)
+    codes = json.dumps(code_table).encode("utf-8")
+    average_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    with open(path + ".tmp", "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(ids), len(terms), len(flat),
+                             len(term_blob), len(codes), average_length))
+        f.write(b"".join(ids))
+        f.write(np.array(lengths, dtype=np.uint32).tobytes())
+        f.write(term_offsets.tobytes())
+        f.write(posting_offsets.tobytes())
+        f.write(posting_docs.tobytes())
+        # Pad the uint16 tf array so everything after it stays 4-byte aligned
+        f.write(posting_tfs.tobytes() + b"\0" * (len(flat) % 2 * 2))
+        f.write(term_blob)
+        f.write(codes)
+    os.replace(path + ".tmp", path)
+    return len(ids)
+
+
+class LexicalIndex:
+    """Memory-mapped BM25 index with exact policy-code lookup.
+
+    Opening maps the file and reads the header and code table; the
+    postings are searched in place, so startup does not grow with the
+    corpus.
+    """
+
+    def __init__(self, path=LEXICAL_INDEX_PATH):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.count, self.term_count, posting_count,
+         term_bytes, code_bytes, self.average_length) = _HEADER.unpack_from(self.data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a version {_VERSION} lexical index")
+        offset = _HEADER.size
+
+        def section(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(self.data, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        self.ids = section("S16", self.count)
+        self.lengths = section(np.uint32, self.count)
+        self.term_offsets = section(np.uint32, self.term_count + 1)
+        self.posting_offsets = section(np.uint32, self.term_count + 1)
+        self.posting_docs = section(np.uint32, posting_count)
+        self.posting_tfs = section(np.uint16, posting_count)
+        offset += posting_count % 2 * 2
+        self.terms_start = offset
+        self.codes = json.loads(self.data[offset + term_bytes:offset + term_bytes + code_bytes])
+
+    def __len__(self):
+        return self.count
+
+    def _term(self, position):
+        start = self.terms_start + int(self.term_offsets[position])
+        return self.data[start:self.terms_start + int(self.term_offsets[position + 1])]
+
+    def _find(self, term):
+        key = term.encode("utf-8")
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            found = self._term(middle)
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def _neighbors(self, docs, scores):
+        return [Neighbor(self.ids[doc].rstrip(b"\0").decode("ascii"), float(score)) for doc, score in zip(docs, scores)]
+
+    def policy_codes(self, text):
+        """Policy codes named in text (e.g. "Policy DH1", "H3") that this index knows."""
+        return [code for code in dict.fromkeys(_CODE.findall(text)) if code in self.codes]
+
+    def is_policy_reference(self, text):
+        """True if text names a known policy and little else (e.g. "Policy H3", "policies DH1 and DH2")."""
+        if not self.policy_codes(text):
+            return False
+        return all(token == "policy" for token in tokenize(_CODE.sub(" ", text)))
+
+    def scores(self, text):
+        """BM25 score of every chunk for the query text."""
+        scores = np.zeros(self.count, dtype=np.float32)
+        if not self.average_length:
+            return scores
+        for term, query_tf in Counter(tokenize(text)).items():
+            position = self._find(term)
+            if position is None:
+                continue
+            start, end = int(self.posting_offsets[position]), int(self.posting_offsets[position + 1])
+            docs = self.posting_docs[start:end]
+            tf = self.posting_tfs[start:end].astype(np.float32)
+            idf = np.log(1.0 + (self.count - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.lengths[docs] / self.average_length)
+            scores[docs] += query_tf * idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+        return scores
+
+    def search(self, text, k=10):
+        """The k best chunks by BM25, as Neighbors whose distance is the BM25 score."""
+        with span("lexical.search"):
+            scores = self.scores(text)
+            k = min(k, int(np.count_nonzero(scores)))
+            if k <= 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return self._neighbors(top, scores[top])
+
+    def lookup(self, text, k=1):
+        """Chunks for the policy codes text names, or [] if it names none.
+
+        Each named policy's own section comes first; distance is 1.0, as for
+        an exact match.
+        """
+        with span("lexical.lookup") as attributes:
+            docs = []
+            for code in self.policy_codes(text):
+                docs.extend(doc for doc in self.codes[code][:k] if doc not in docs)
+            attributes["matches"] = len(docs)
+            return self._neighbors(docs[:k], [1.0] * len(docs[:k]))
+
+
+def open_lexical_index(path=LEXICAL_INDEX_PATH, chunk_store_path=CHUNK_STORE_PATH, json_path="policy_chunks.json"):
+    """Opens the lexical index, building it from the chunk store (or policy_chunks.json) if missing or outdated."""
+    if os.path.exists(path):
+        try:
+            return LexicalIndex(path)
+        except ValueError as e:
+            print(f"⚠️ {e}; rebuilding it")
+    if os.path.exists(chunk_store_path + ".idx"):
+        count = write_lexical_index(ChunkStore(chunk_store_path).items(), path)
+    else:
+        count = write_lexical_index(load_policy_chunks(json_path).items(), path)
+    print(f"✅ Built lexical index over {count} chunks at {path}")
+    return LexicalIndex(path)
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    lexical = open_lexical_index()
+    for query in sys.argv[1:]:
+        print(f"\n🔍 {query}")
+        for neighbor in lexical.lookup(query, 3) or lexical.search(query, 3):
+            print(f"  {neighbor.id}  {neighbor.distance:.3f}")
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+from tracing import span
+
+# --- Configuration ---
+LLM_CACHE_PATH = ".llm_cache.sqlite"
+LLM_CACHE_TTL_SECONDS = 30 * 24 * 3600 # Responses older than this are regenerated
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024 # Least recently used responses are evicted beyond this
+LLM_CACHE_BYPASS = os.environ.get("LLM_CACHE_BYPASS") == "1" # Always call Gemini, never read or write
+TOUCH_FLUSH_ENTRIES = 100 # Hits whose last_used is held in memory before being written in one commit
+
+
+def response_key(model_name, prompt, generation_config=None):
+    """Cache key for a generation: hash of (model, prompt, generation settings)."""
+    settings = json.dumps(generation_config or {}, sort_keys=True, default=str)
+    return hashlib.sha256(f"{model_name}\0{settings}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Persistent cache of Gemini responses with TTL and size-based LRU eviction.
+
+    Each entry remembers the tokens and seconds the original call cost, so
+    hits can report what they saved. As in EmbeddingCache, hits only note
+    when they were used (written every TOUCH_FLUSH_ENTRIES hits, before
+    eviction and at exit) and the total response size is a running count
+    stored in the database.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl_seconds=LLM_CACHE_TTL_SECONDS, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.seconds_saved = 0.0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, tokens INTEGER NOT NULL, "
+            "seconds REAL NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+        # Counted once when the table is new; afterwards every write keeps it up to date
+        self.db.execute("INSERT OR IGNORE INTO cache_size SELECT 0, COALESCE(SUM(LENGTH(response)), 0) FROM responses")
+        self.db.commit()
+        self.touched = {}
+        atexit.register(self.flush)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response, tokens, seconds FROM responses WHERE key = ? AND created > ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.touched[key] = now
+            if len(self.touched) >= TOUCH_FLUSH_ENTRIES:
+                self._write_touches()
+                self.db.commit()
+            self.hits += 1
+            self.tokens_saved += row[1]
+            self.seconds_saved += row[2]
+        return row[0]
+
+    def put(self, key, response, tokens, seconds):
+        now = time.time()
+        with self.lock:
+            # Take the write lock first, so no other process changes this row between the count and the insert
+            self.db.execute("BEGIN IMMEDIATE")
+            replaced = self.db.execute("SELECT LENGTH(response) FROM responses WHERE key = ?", (key,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, tokens, seconds, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (key, response, tokens, seconds, now, now)
+            )
+            size = self.db.execute("SELECT LENGTH(response) FROM responses WHERE key = ?", (key,)).fetchone()[0]
+            self._add_bytes(size - (replaced[0] if replaced else 0))
+            self._write_touches()
+            self._evict(now)
+            self.db.commit()
+
+    def flush(self):
+        """Writes the last_used times of hits not yet saved."""
+        with self.lock:
+            if self.touched:
+                self._write_touches()
+                self.db.commit()
+
+    def _write_touches(self):
+        self.db.executemany("UPDATE responses SET last_used = ? WHERE key = ?",
+                            [(now, key) for key, now in self.touched.items()])
+        self.touched = {}
+
+    def _add_bytes(self, delta):
+        self.db.execute("UPDATE cache_size SET bytes = bytes + ? WHERE id = 0", (delta,))
+
+    def _total_bytes(self):
+        return self.db.execute("SELECT bytes FROM cache_size WHERE id = 0").fetchone()[0]
+
+    def _evict(self, now):
+        expired = self.db.execute(
+            "SELECT COALESCE(SUM(LENGTH(response)), 0) FROM responses WHERE created <= ?", (now - self.ttl_seconds,)
+        ).fetchone()[0]
+        self.db.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl_seconds,))
+        self._add_bytes(-expired)
+        total = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        stale, removed = [], 0
+        for key, size in self.db.execute("SELECT key, LENGTH(response) FROM responses ORDER BY last_used"):
+            if total - removed <= self.max_bytes:
+                break
+            stale.append((key,))
+            removed += size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", stale)
+        self._add_bytes(-removed)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "tokens_saved": self.tokens_saved, "seconds_saved": round(self.seconds_saved, 2)}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """The process-wide response cache at LLM_CACHE_PATH."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
+
+
+def generate_cached(model, prompt, generation_config=None, bypass=LLM_CACHE_BYPASS):
+    """model.generate_content(prompt).text, served from the cache when possible."""
+    with span("gemini.generate", request_bytes=len(prompt.encode("utf-8"))) as attributes:
+        if not bypass:
+            cache = get_default_cache()
+            key = response_key(model.model_name, prompt, generation_config)
+            cached = cache.get(key)
+            if cached is not None:
+                attributes.update(cache_hits=1, response_bytes=len(cached.encode("utf-8")))
+                return cached
+        attributes["cache_misses"] = 1
+        started = time.perf_counter()
+        response = model.generate_content(prompt, generation_config=generation_config)
+        seconds = time.perf_counter() - started
+        usage = getattr(response, "usage_metadata", None)
+        tokens = getattr(usage, "total_token_count", 0) or 0
+        attributes.update(tokens=tokens, response_bytes=len(response.text.encode("utf-8")))
+        if not bypass:
+            cache.put(key, response.text, tokens, seconds)
+        return response.text
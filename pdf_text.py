@@ -0,0 +1,49 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from tracing import span
+
+# --- Configuration ---
+PAGES_PER_TASK = 16 # Pages handed to each worker process at a time
+
+
+def _extract_page_range(full_pdf_path, first_page, last_page):
+    """Extracts the text of pages [first_page, last_page) in a worker process."""
+    import fitz
+    with span("pdf.extract_pages", pages=last_page - first_page), fitz.open(full_pdf_path) as doc:
+        return [(n + 1, doc[n].get_text("text")) for n in range(first_page, last_page)]
+
+
+def iter_pdf_pages(full_pdf_path, workers=1, pages_per_task=PAGES_PER_TASK):
+    """Yields (page_number, text) for each page of a PDF, in page order.
+
+    With workers > 1 the page ranges are fanned out to a process pool. Only a
+    bounded window of ranges is in flight at once, so memory stays at a few
+    ranges of text however long the document is.
+    """
+    # Imported here so entry points that never read a PDF don't pay for PyMuPDF
+    import fitz
+    with fitz.open(full_pdf_path) as doc:
+        page_count = doc.page_count
+        print(f"✅ Successfully opened '{os.path.basename(full_pdf_path)}'. Pages: {page_count}")
+        if workers <= 1:
+            for n in range(page_count):
+                with span("pdf.extract_pages", pages=1):
+                    text = doc[n].get_text("text")
+                yield n + 1, text
+            return
+
+    ranges = [(first, min(first + pages_per_task, page_count)) for first in range(0, page_count, pages_per_task)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for first, last in ranges:
+            pending.append(pool.submit(_extract_page_range, full_pdf_path, first, last))
+            # Keep at most two ranges per worker queued ahead of the consumer
+            if len(pending) >= workers * 2:
+                with span("pdf.wait_for_worker"):
+                    pages = pending.pop(0).result()
+                yield from pages
+        for future in pending:
+            with span("pdf.wait_for_worker"):
+                pages = future.result()
+            yield from pages
+
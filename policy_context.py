@@ -0,0 +1,116 @@
+import re
+from collections import namedtuple
+from chunking import CHARS_PER_TOKEN
+from tracing import span
+
+# --- Configuration ---
+CONTEXT_TOKEN_BUDGET = 1000 # Policy text packed into each compliance prompt (~4 chunks)
+NEAR_DUPLICATE_THRESHOLD = 0.8 # Share of a passage's word 3-grams already covered by a better one
+MIN_OVERLAP_CHARS = 20 # Shortest suffix/prefix overlap treated as repeated text when joining chunks
+PASSAGE_SEPARATOR = "\n\n[...]\n\n"
+
+# ids of the merged chunks in document order, the joined text, and the best rank among them
+Passage = namedtuple("Passage", ["ids", "text", "rank"])
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"[.!?]\s")
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _join(left, right):
+    """Concatenates two consecutive chunks, dropping text repeated across the boundary."""
+    probe = right[:MIN_OVERLAP_CHARS]
+    # Earliest match first, so the longest overlap wins
+    position = left.find(probe, max(0, len(left) - len(right))) if len(probe) == MIN_OVERLAP_CHARS else -1
+    while position >= 0:
+        if right.startswith(left[position:]):
+            return left[:position] + right
+        position = left.find(probe, position + 1)
+    return left + "\n" + right
+
+
+def merge_passages(neighbors, policy_chunks):
+    """Turns ranked neighbors into passages, merging chunks that sit next to each other in the source.
+
+    Adjacency comes from ChunkStore.location; for a plain {id: text} mapping
+    every chunk is its own passage. Passages are returned best rank first.
+    """
+    located, passages = [], []
+    for rank, neighbor in enumerate(neighbors):
+        text = policy_chunks.get(neighbor.id)
+        if text is None:
+            continue
+        try:
+            location = policy_chunks.location(neighbor.id)
+        except AttributeError:
+            passages.append(Passage([neighbor.id], text, rank))
+            continue
+        located.append((location, rank, neighbor.id, text))
+
+    run = []
+    for item in sorted(set(located)) + [None]:
+        if run and item is not None:
+            (source, offset, length), (next_source, next_offset, _) = run[-1][0], item[0]
+            if next_source == source and next_offset in (offset, offset + length):
+                if next_offset != offset:
+                    run.append(item)
+                continue
+        if run:
+            text = run[0][3]
+            for _, _, _, next_text in run[1:]:
+                text = _join(text, next_text)
+            passages.append(Passage([i for _, _, i, _ in run], text, min(rank for _, rank, _, _ in run)))
+        run = [item]
+    return sorted(passages, key=lambda passage: passage.rank)
+
+
+def _shingles(text):
+    words = _WORD.findall(text.lower())
+    return {tuple(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+
+def drop_near_duplicates(passages, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """Keeps passages in order, skipping any mostly covered by one already kept."""
+    kept, kept_shingles = [], []
+    for passage in passages:
+        shingles = _shingles(passage.text)
+        # Measured against the candidate's own size: containing a short kept passage is not enough
+        if any(len(shingles & other) >= threshold * len(shingles) for other in kept_shingles):
+            continue
+        kept.append(passage)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def pack_passages(passages, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Greedily fits passages into token_budget in rank order.
+
+    A passage that does not fit is skipped in favour of later, shorter ones;
+    if even the best passage is too long it is cut at a sentence boundary.
+    """
+    packed, used = [], 0
+    separator_tokens = estimate_tokens(PASSAGE_SEPARATOR)
+    for passage in passages:
+        cost = estimate_tokens(passage.text) + (separator_tokens if packed else 0)
+        if used + cost <= token_budget:
+            packed.append(passage)
+            used += cost
+        elif not packed:
+            limit = token_budget * CHARS_PER_TOKEN
+            cut = max((m.end() for m in _SENTENCE_END.finditer(passage.text, 0, limit)), default=limit)
+            packed.append(passage._replace(text=passage.text[:cut].rstrip()))
+            used = estimate_tokens(packed[0].text)
+    return packed
+
+
+def assemble_context(neighbors, policy_chunks, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Policy text for one claim: merged, de-duplicated passages within token_budget, best first."""
+    with span("context.assemble", chunks=len(neighbors)) as attributes:
+        passages = drop_near_duplicates(merge_passages(neighbors, policy_chunks))
+        packed = pack_passages(passages, token_budget)
+        text = PASSAGE_SEPARATOR.join(passage.text for passage in packed)
+        attributes.update(passages=len(packed), context_tokens=estimate_tokens(text))
+        return text
@@ -0,0 +1,149 @@
+import os
+import json
+import stat
+import time
+import socketserver
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import analyze_das
+from clients import get_secret, configure_genai, get_generative_model, http_session
+from chunk_store import open_chunk_store
+from lexical_index import open_lexical_index
+from search_index import find_passages, NUM_CANDIDATES
+from tracing import span
+
+# --- Configuration ---
+SERVER_HOST = "127.0.0.1" # Local clients only; the server has no authentication
+SERVER_PORT = 8765
+MAX_BODY_BYTES = 64 * 1024 # Larger request bodies are rejected with a 413
+MAX_SEARCH_K = 50 # Larger "k" values in /search are clamped to this
+
+
+class QueryService:
+    """Secrets, index clients, chunk store and lexical index, loaded once and shared by all requests.
+
+    The embedding and LLM caches are the process-wide defaults, so they stay
+    open too. Every method is safe to call from several threads at once.
+    """
+
+    def __init__(self):
+        self.policy_chunks = open_chunk_store()
+        self.lexical_index = open_lexical_index()
+        self.api_key = get_secret(analyze_das.GCP_PROJECT_ID, "google-api-key")
+        self.index = analyze_das.open_analysis_index()
+        # Set up the Gemini client and the keep-alive pool now rather than on the first request
+        configure_genai(self.api_key)
+        get_generative_model(analyze_das.GEMINI_MODEL)
+        http_session()
+        self.started = time.time()
+
+    def search(self, query, k=NUM_CANDIDATES):
+        """Policy passages for a query: merged, de-duplicated and best first."""
+        neighbors, passages = find_passages(query, self.index, self.api_key, self.policy_chunks,
+                                            self.lexical_index, num_neighbors=k)
+        if neighbors is None:
+            raise RuntimeError("Policy search failed")
+        return {"query": query, "passages": [
+            {"ids": passage.ids, "distance": neighbors[passage.rank].distance, "text": passage.text}
+            for passage in passages
+        ]}
+
+    def analyze(self, claim):
+        """The compliance analysis of one claim or objection against the policies it retrieves."""
+        return analyze_das.analyze_claim(claim, self.index, self.policy_chunks, self.api_key, self.lexical_index)
+
+    def health(self):
+        return {"status": "ok", "policy_chunks": len(self.policy_chunks),
+                "uptime_s": round(time.time() - self.started, 1)}
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    """GET /health, POST /search {"query", "k"} and POST /analyze {"claim"}; replies are JSON.
+
+    "k" is optional; it must be a positive integer and is clamped to MAX_SEARCH_K.
+    """
+
+    protocol_version = "HTTP/1.1" # Keep-alive, so a client can reuse its connection
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply(200, self.server.service.health())
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        length = self.headers.get("Content-Length") or "0"
+        if not length.isdigit():
+            # A bad length leaves the body unreadable, so the connection cannot be reused
+            self.close_connection = True
+            return self._reply(400, {"error": "Content-Length must be a non-negative integer"})
+        length = int(length)
+        if length > MAX_BODY_BYTES:
+            # The body is left unread, so the connection cannot be reused
+            self.close_connection = True
+            return self._reply(413, {"error": f"Request body over {MAX_BODY_BYTES} bytes"})
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._reply(400, {"error": "Request body is not valid JSON"})
+        service = self.server.service
+        routes = {
+            "/search": ("query", lambda text: service.search(text, k)),
+            "/analyze": ("claim", service.analyze),
+        }
+        if self.path not in routes:
+            return self._reply(404, {"error": f"Unknown path {self.path}"})
+        field, handler = routes[self.path]
+        text = body.get(field) if isinstance(body, dict) else None
+        if not isinstance(text, str) or not text.strip():
+            return self._reply(400, {"error": f"Expected a JSON object with a non-empty \"{field}\""})
+        k = body.get("k", NUM_CANDIDATES) if self.path == "/search" else NUM_CANDIDATES
+        # bool is an int subclass, but true/false is not a count
+        if not isinstance(k, int) or isinstance(k, bool) or k < 1:
+            return self._reply(400, {"error": "\"k\" must be a positive integer"})
+        k = min(k, MAX_SEARCH_K)
+        try:
+            with span(f"server{self.path}"):
+                self._reply(200, handler(text))
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(host=SERVER_HOST, port=SERVER_PORT, socket_path=None):
+    """Loads a QueryService and answers requests on host:port, or on a Unix socket, until Ctrl-C."""
+    started = time.perf_counter()
+    service = QueryService()
+    if socket_path:
+        # Only a socket left behind by an earlier server is removed, never another kind of file
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.remove(socket_path)
+        server = _ThreadingUnixHTTPServer(socket_path, _QueryHandler)
+        where = f"unix:{socket_path}"
+    else:
+        server = ThreadingHTTPServer((host, port), _QueryHandler)
+        server.daemon_threads = True
+        where = f"http://{host}:{server.server_address[1]}"
+    server.service = service
+    print(f"✅ Serving on {where} (ready in {time.perf_counter() - started:.1f}s). Press Ctrl-C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n✅ Server stopped.")
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
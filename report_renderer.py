@@ -0,0 +1,150 @@
+import os
+import hashlib
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from tracing import span
+
+# --- Configuration ---
+FONT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORT_FONTS = {"": "DejaVuSans.ttf", "B": "DejaVuSans-Bold.ttf"}
+# Latin, Greek, punctuation, currency, letterlike, arrows, maths, shapes and ligatures
+REPORT_UNICODE_RANGES = "U+0020-02FF,U+0370-03FF,U+2000-22FF,U+25A0-25FF,U+FB00-FB06"
+FONT_CACHE_DIR = ".font_cache"
+FALLBACK_FONT_FAMILY = "DejaVuFull" # The full fonts, loaded only for reports using characters outside the subset
+REPORT_TITLE = "Planning Objection Analysis Report"
+
+
+def _subset_font(source_path):
+    """Writes (once per machine) a copy of the font cut down to REPORT_UNICODE_RANGES."""
+    with open(source_path, "rb") as f:
+        digest = hashlib.sha256(f.read() + REPORT_UNICODE_RANGES.encode("ascii")).hexdigest()[:12]
+    name, ext = os.path.splitext(os.path.basename(source_path))
+    subset_path = os.path.join(FONT_CACHE_DIR, f"{name}.{digest}{ext}")
+    if not os.path.exists(subset_path):
+        from fontTools import subset, ttLib
+        os.makedirs(FONT_CACHE_DIR, exist_ok=True)
+        options = subset.Options()
+        options.notdef_outline = True
+        options.drop_tables += ["FFTM"]
+        font = ttLib.TTFont(source_path)
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=subset.parse_unicodes(REPORT_UNICODE_RANGES))
+        subsetter.subset(font)
+        # Another process may be writing the same file; the rename is atomic
+        temp_path = f"{subset_path}.{os.getpid()}.tmp{ext}"
+        font.save(temp_path)
+        os.replace(temp_path, subset_path)
+    return subset_path
+
+
+def _subset_ranges(ranges=REPORT_UNICODE_RANGES):
+    bounds = []
+    for part in ranges.split(","):
+        low, _, high = part.removeprefix("U+").partition("-")
+        bounds.append((int(low, 16), int(high or low, 16)))
+    return bounds
+
+
+_SUBSET_BOUNDS = _subset_ranges()
+
+
+def outside_subset(text):
+    """True if text has a printable character the subset fonts do not cover (e.g. Cyrillic, ✓, ★, box drawing)."""
+    return any(
+        ord(char) >= 0x20 and not any(low <= ord(char) <= high for low, high in _SUBSET_BOUNDS)
+        for char in set(text)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def report_font_paths():
+    """{style: subset font path}, computed once per process.
+
+    The subset fonts are a fraction of the size of the full DejaVu files, so
+    FPDF parses them several times faster for every report.
+    """
+    return {style: _subset_font(os.path.join(FONT_DIR, name)) for style, name in REPORT_FONTS.items()}
+
+
+class ReportRenderer:
+    """Lays out results as they arrive and writes the PDF to a path or binary stream on close.
+
+    Text is set in the subset fonts; the first result with a character
+    outside them adds the full DejaVu fonts as a fallback, so every glyph
+    the full fonts have still renders. Nothing is written if no result was
+    ever added.
+    """
+
+    def __init__(self, output="objection_report.pdf", title=REPORT_TITLE):
+        self.output = output
+        self.title = title
+        self.pdf = None
+        self.fallback = False
+        self.results_rendered = 0
+
+    def _start(self):
+        # fpdf2 takes about half a second to import, so only processes that write a report load it
+        from fpdf import FPDF
+        from fpdf.enums import XPos, YPos
+        self.pdf = FPDF()
+        for style, path in report_font_paths().items():
+            self.pdf.add_font("DejaVu", style, path)
+        self.fallback = False
+        self.pdf.add_page()
+        self.pdf.set_font("DejaVu", 'B', 16)
+        self.pdf.cell(0, 10, text=self.title, new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
+        self.pdf.ln(10)
+
+    def add_result(self, result):
+        with span("report.layout"):
+            if self.pdf is None:
+                self._start()
+            if not self.fallback and outside_subset(f"{result['claim']}{result['analysis']}"):
+                for style, name in REPORT_FONTS.items():
+                    self.pdf.add_font(FALLBACK_FONT_FAMILY, style, os.path.join(FONT_DIR, name))
+                self.pdf.set_fallback_fonts([FALLBACK_FONT_FAMILY])
+                self.fallback = True
+            self.pdf.set_font("DejaVu", 'B', 12)
+            self.pdf.multi_cell(0, 5, text=f"[Developer Claim]: {result['claim']}")
+            self.pdf.ln(5)
+            self.pdf.set_font("DejaVu", '', 12)
+            # Near-duplicate claims carry the finding of the first claim in their cluster
+            label = "[Compliance Analysis, shared with a near-identical claim]" if "shared_with" in result \
+                else "[Compliance Analysis]"
+            self.pdf.multi_cell(0, 5, text=f"{label}: {result['analysis']}")
+            self.pdf.ln(10)
+        self.results_rendered += 1
+
+    def close(self):
+        """Writes the report; returns False if there was nothing to write."""
+        if self.pdf is None:
+            return False
+        with span("report.write", results=self.results_rendered):
+            if hasattr(self.output, "write"):
+                self.output.write(self.pdf.output())
+            else:
+                self.pdf.output(self.output)
+        self.pdf = None
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def render_report(results_data, output="objection_report.pdf"):
+    """Renders a complete list of results in one go; returns False if it was empty."""
+    renderer = ReportRenderer(output)
+    for result in results_data:
+        renderer.add_result(result)
+    return renderer.close()
+
+
+def render_reports_parallel(jobs, workers=None):
+    """Renders (results_data, output_path) jobs in worker processes, returning one bool per job."""
+    results_list, paths = zip(*jobs) if jobs else ((), ())
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(render_report, results_list, paths))
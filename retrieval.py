@@ -0,0 +1,62 @@
+from embeddings import embed_texts
+from vector_index import Neighbor
+from tracing import span
+
+# --- Configuration ---
+FUSION_CANDIDATES = 20 # Neighbors taken from each of the lexical and vector rankings before fusing
+RRF_K = 60 # Reciprocal rank fusion damping; larger values flatten the rank weights
+
+
+def fuse_rankings(rankings, k=RRF_K):
+    """Reciprocal rank fusion of several Neighbor lists.
+
+    Returns Neighbors ordered by fused score, with distance set to that score
+    (larger is closer, as for DOT_PRODUCT_DISTANCE).
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, neighbor in enumerate(ranking):
+            scores[neighbor.id] = scores.get(neighbor.id, 0.0) + 1.0 / (k + rank + 1)
+    return [Neighbor(i, score) for i, score in sorted(scores.items(), key=lambda item: -item[1])]
+
+
+def search_policies(query_texts, index, api_key, num_neighbors=1, lexical_index=None):
+    """Embeds all queries in one call and searches them as one batch.
+
+    With a LexicalIndex, a query that is just a policy reference ("Policy
+    H3") is answered from the code table without any network call. In any
+    other query, the chunks of a policy it names are fused with the BM25
+    and vector rankings, so the named policy ranks highly but never stops
+    the rest of the query from being searched.
+    Returns one neighbor list per query, aligned with query_texts.
+    """
+    query_texts = list(query_texts)
+    if not query_texts:
+        return []
+    with span("retrieval.search", items=len(query_texts)) as attributes:
+        results = [None] * len(query_texts)
+        if lexical_index is not None:
+            for i, text in enumerate(query_texts):
+                if lexical_index.is_policy_reference(text):
+                    results[i] = lexical_index.lookup(text, num_neighbors) or None
+        remaining = [i for i, result in enumerate(results) if result is None]
+        attributes["exact_matches"] = len(query_texts) - len(remaining)
+        if not remaining:
+            return results
+        query_embeddings = embed_texts([query_texts[i] for i in remaining], api_key, task_type="RETRIEVAL_QUERY")
+        if lexical_index is None:
+            neighbor_lists = index.find_neighbors(query_embeddings, num_neighbors=num_neighbors)
+        else:
+            neighbor_lists = index.find_neighbors(
+                query_embeddings, num_neighbors=max(num_neighbors, FUSION_CANDIDATES)
+            )
+            code_hits = [lexical_index.lookup(query_texts[i], FUSION_CANDIDATES) for i in remaining]
+            attributes["code_matches"] = sum(1 for hits in code_hits if hits)
+            neighbor_lists = [
+                fuse_rankings([vector_neighbors, lexical_index.search(query_texts[i], FUSION_CANDIDATES), hits])
+                [:num_neighbors]
+                for i, vector_neighbors, hits in zip(remaining, neighbor_lists, code_hits)
+            ]
+        for i, neighbors in zip(remaining, neighbor_lists):
+            results[i] = neighbors
+        return results
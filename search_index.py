@@ -1,99 +1,82 @@
 import os
-import json
-import google.generativeai as genai
-import requests
-from google.cloud import secretmanager
+import argparse
+import tracing
+from clients import get_secret
+from analyze_das import open_analysis_index, GCP_PROJECT_ID
+from chunk_store import open_chunk_store
+from lexical_index import open_lexical_index
+from retrieval import search_policies
+from policy_context import merge_passages, drop_near_duplicates, pack_passages
 
 # --- Configuration ---
-GCP_PROJECT_ID = "crucial-accord-467816-g0"
-INDEX_ENDPOINT_ID = "islington_policy_endpoint_1754245523158"
-GCP_LOCATION = "europe-west2"
+NUM_CANDIDATES = 8 # Chunks retrieved before merging adjacent ones and dropping near-duplicates
+SAMPLE_QUERY = "The proposed building is too tall and will block sunlight." # Searched when no query is given
 
-def get_secret(project_id, secret_id, version_id="latest"):
-    """Fetches a secret from Google Cloud Secret Manager."""
-    client = secretmanager.SecretManagerServiceClient()
-    name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
-    response = client.access_secret_version(request={"name": name})
-    return response.payload.data.decode("UTF-8")
+def search_vector_index(query_text, index, api_key, lexical_index=None, num_neighbors=NUM_CANDIDATES):
+    """Takes a query, embeds it, and searches the configured vector index backend.
 
-def search_vector_index(query_text, access_token, api_key):
-    """Takes a query, embeds it, and searches the Vector Search index."""
+    With a LexicalIndex, a bare policy reference is answered locally; in
+    other queries, BM25 and the chunks of any policy named are fused with
+    the vector ranking.
+    """
     print(f"\n--- Searching for policies related to: '{query_text}' ---")
-
-    # 1. Generate embedding for the user's query
     try:
-        genai.configure(api_key=api_key)
-        query_embedding = genai.embed_content(
-            model="models/text-embedding-004",
-            content=query_text,
-            task_type="RETRIEVAL_QUERY" # Use RETRIEVAL_QUERY for search
-        )['embedding']
-        print("✅ Query embedding generated.")
+        # Repeated queries come from the embedding cache
+        return search_policies([query_text], index, api_key, num_neighbors=num_neighbors,
+                               lexical_index=lexical_index)[0]
     except Exception as e:
-        print(f"❌ Error generating query embedding: {e}")
+        print(f"❌ Error searching index:")
+        print(e)
         return None
 
-    # 2. Prepare the direct API call
-    endpoint_url = f"https://{GCP_LOCATION}-aiplatform.googleapis.com/v1/projects/{GCP_PROJECT_ID}/locations/{GCP_LOCATION}/indexEndpoints/{INDEX_ENDPOINT_ID}:findNeighbors"
-
-    # ADD THE DEPLOYED_INDEX_ID HERE
-    request_body = {
-        "deployedIndexId": "islington_policy_endpoint_1754245523158",
-        "queries": [{
-            "datapoint": {"featureVector": query_embedding},
-            "neighborCount": 3 # Find the top 3 matches
-        }]
-    }
-
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+def find_passages(query_text, index, api_key, policy_chunks, lexical_index=None, num_neighbors=NUM_CANDIDATES):
+    """Searches, then merges adjacent chunks and drops near-duplicates; returns (neighbors, passages)."""
+    search_results = search_vector_index(query_text, index, api_key, lexical_index, num_neighbors)
+    if not search_results:
+        return search_results, []
+    return search_results, pack_passages(drop_near_duplicates(merge_passages(search_results, policy_chunks)))
 
-    # 3. Make the API call
-    response = requests.post(endpoint_url, headers=headers, data=json.dumps(request_body))
+def open_search_index():
+    """Fetches the API key and returns (api_key, vector index) for searching.
 
-    # 4. Process and print the results
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"❌ Error searching index:")
-        print(f"Status Code: {response.status_code}")
-        print(f"Response: {response.text}")
-        return None
+    The index is analyze_das's, so this and the query server search the same deployed endpoint.
+    """
+    print("🔐 Fetching secrets...")
+    api_key = get_secret(GCP_PROJECT_ID, "google-api-key")
+    print("✅ Secrets fetched.")
+    return api_key, open_analysis_index()
 
-# --- Main Execution Block ---
-if __name__ == "__main__":
+def run_search(queries):
+    """Searches each query and prints the matching policy passages."""
     # Load the text chunks from the file
     try:
-        with open("policy_chunks.json", "r") as f:
-            policy_chunks = json.load(f)
+        policy_chunks = open_chunk_store()
     except FileNotFoundError:
-        print("❌ Error: policy_chunks.json not found. Please run extract_text.py first.")
-        exit()
+        print("❌ Error: policy chunk store not found. Please run extract_text.py first.")
+        return
+    lexical_index = open_lexical_index()
+    api_key, index = open_search_index()
 
-    # Fetch secrets
-    print("🔐 Fetching secrets...")
-    GOOGLE_API_KEY = get_secret(GCP_PROJECT_ID, "google-api-key")
-    ACCESS_TOKEN = get_secret(GCP_PROJECT_ID, "gcp-access-token")
-    print("✅ Secrets fetched.")
+    for query in queries:
+        search_results, passages = find_passages(query, index, api_key, policy_chunks, lexical_index)
 
-    # Define a sample user objection to search for
-    SAMPLE_QUERY = "The proposed building is too tall and will block sunlight."
+        # Display the results
+        if search_results:
+            # Overlapping and adjacent chunks come back as one passage; near-duplicates are dropped
+            print(f"\n✅ Found {len(passages)} Matching Policy Passages from {len(search_results)} chunks:")
+            for passage in passages:
+                match_distance = search_results[passage.rank].distance
 
-    # Search the index
-    search_results = search_vector_index(SAMPLE_QUERY, ACCESS_TOKEN, GOOGLE_API_KEY)
+                print("\n----------------------------------")
+                print(f"MATCH (Distance: {match_distance:.4f}, chunks: {', '.join(passage.ids)}):")
+                print(passage.text)
+                print("----------------------------------")
 
-    # Display the results
-    if search_results:
-        print("\n✅ Found Top 3 Matching Policies:")
-        for neighbor in search_results['nearestNeighbors'][0]['neighbors']:
-            # Get the ID and use it to look up the text in our loaded file
-            match_id = int(neighbor['datapoint']['datapointId'])
-            match_text = policy_chunks[match_id]
-            match_distance = neighbor['distance']
-
-            print("\n----------------------------------")
-            print(f"MATCH (Distance: {match_distance:.4f}):")
-            print(match_text)
-            print("----------------------------------")
\ No newline at end of file
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the policy index with a sample objection.")
+    parser.add_argument("queries", nargs="*", default=[SAMPLE_QUERY], help="Objections to search for")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.start(args.trace, args.profile)
+    run_search(args.queries)
@@ -1,61 +1,46 @@
-import requests
-import json
-import google.generativeai as genai
-from google.cloud import secretmanager
+import argparse
+import functools
+import tracing
+from clients import get_secret, get_access_token
+from embeddings import embed_texts
+from vector_index import get_vector_index, VECTOR_INDEX_BACKEND
+from index_sync import chunk_id
 
 # --- Configuration ---
 GCP_PROJECT_ID = "crucial-accord-467816-g0"
 INDEX_ID = "8241710463390318592" # Paste your actual Index ID here
 GCP_LOCATION = "europe-west2"
 
-def get_secret(project_id, secret_id, version_id="latest"):
-    """Fetches a secret from Google Cloud Secret Manager."""
-    client = secretmanager.SecretManagerServiceClient()
-    name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
-    response = client.access_secret_version(request={"name": name})
-    return response.payload.data.decode("UTF-8")
-
-def upsert_via_rest(embeddings, access_token):
-    """Saves the embeddings to Vector Search using a direct REST API call."""
+def upsert_test_datapoints(embeddings, index):
+    """Saves the embeddings to the configured vector index backend."""
     print("\n--- Testing Upsert to Vector Search ---")
 
-    # CORRECTED URL: Targets the 'indexes' path
-    endpoint_url = f"https://{GCP_LOCATION}-aiplatform.googleapis.com/v1/projects/{GCP_PROJECT_ID}/locations/{GCP_LOCATION}/indexes/{INDEX_ID}:upsertDatapoints"
-
-    datapoints = [{"datapointId": "test_id_1", "featureVector": embedding} for embedding in embeddings]
-    request_body = {"datapoints": datapoints}
-
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-
-    response = requests.post(endpoint_url, headers=headers, data=json.dumps(request_body))
-
-    if response.status_code == 200:
+    try:
+        # Content-derived IDs, so re-running the test overwrites rather than duplicates
+        index.upsert([chunk_id(f"This is a test {i}") for i in range(len(embeddings))], embeddings)
         print("✅ Successfully upserted datapoints.")
-    else:
+    except Exception as e:
         print(f"❌ Error upserting to Vector Search:")
-        print(f"Status Code: {response.status_code}")
-        print(f"Response: {response.text}")
+        print(e)
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Smoke-test upserting a single datapoint.")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.start(args.trace, args.profile)
+
     # 1. Fetch secrets
     print("🔐 Fetching secrets...")
     GOOGLE_API_KEY = get_secret(GCP_PROJECT_ID, "google-api-key")
-    ACCESS_TOKEN = get_secret(GCP_PROJECT_ID, "gcp-access-token")
+    ACCESS_TOKEN = functools.partial(get_access_token, GCP_PROJECT_ID) if VECTOR_INDEX_BACKEND == "vertex" else None
     print("✅ Secrets fetched.")
+    index = get_vector_index(access_token=ACCESS_TOKEN, project_id=GCP_PROJECT_ID, location=GCP_LOCATION, index_id=INDEX_ID)
 
     # 2. Generate a single test embedding
     print("\n--- Generating test embedding ---")
-    genai.configure(api_key=GOOGLE_API_KEY)
-    test_embedding = genai.embed_content(
-        model="models/text-embedding-004",
-        content="This is a test",
-        task_type="RETRIEVAL_DOCUMENT"
-    )['embedding']
+    test_embedding = embed_texts(["This is a test"], GOOGLE_API_KEY, task_type="RETRIEVAL_DOCUMENT")[0]
     print("✅ Test embedding generated.")
 
     # 3. Call the upsert function with the test embedding
-    upsert_via_rest([test_embedding], ACCESS_TOKEN)
\ No newline at end of file
+    upsert_test_datapoints([test_embedding], index)
\ No newline at end of file
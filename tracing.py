@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import atexit
+import pstats
+import cProfile
+import itertools
+import threading
+import contextlib
+import sysconfig
+import contextvars
+from collections import Counter
+
+# --- Configuration ---
+TRACE_PATH = os.environ.get("TRACE_PATH") # Spans are appended here as JSON lines; unset keeps them in memory only
+PROFILE_MODE = os.environ.get("TRACE_PROFILE") # "cprofile" or "sample"; unset disables profiling
+PROFILE_PATH = "profile.prof" # cProfile stats are dumped here for snakeviz/pstats
+SAMPLE_INTERVAL_SECONDS = 0.005 # Sampling profiler: time between stack snapshots
+PROFILE_TOP_N = 20 # Functions listed in the profiler report
+SUMMARY_TOP_N = 15 # Spans listed in the end-of-run table
+COUNTERS = ("request_bytes", "response_bytes", "tokens", "retries", "cache_hits", "cache_misses")
+
+_STDLIB = sysconfig.get_paths()["stdlib"]
+
+# (span id, attributes) of the innermost open span in this thread/task
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Collects spans with wall and CPU time, keeping per-name totals for the summary.
+
+    Spans must open and close in the same thread or task; CPU time is that
+    thread's, so it is only meaningful for synchronous code.
+    """
+
+    def __init__(self, path=None):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.totals = {}
+        self.file = None
+        self.started = time.perf_counter()
+        self.open(path)
+
+    def open(self, path):
+        """Starts appending span records to path (line-buffered, so each span is one write)."""
+        if path:
+            self.file = open(path, "a", buffering=1)
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """Times the block; the yielded dict takes extra attributes such as tokens or cache_hits."""
+        span_id = next(self.ids)
+        parent = _current_span.get()
+        token = _current_span.set((span_id, attributes))
+        start_time = time.time()
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        error = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            wall = time.perf_counter() - started
+            cpu = time.thread_time() - cpu_started
+            _current_span.reset(token)
+            self._record(name, span_id, parent and parent[0], start_time, wall, cpu, error, attributes)
+
+    def _record(self, name, span_id, parent, start_time, wall, cpu, error, attributes):
+        with self.lock:
+            total = self.totals.setdefault(name, dict.fromkeys(("calls", "wall", "cpu", "errors") + COUNTERS, 0))
+            total["calls"] += 1
+            total["wall"] += wall
+            total["cpu"] += cpu
+            total["errors"] += error is not None
+            for key in COUNTERS:
+                total[key] += attributes.get(key) or 0
+            if self.file:
+                self.file.write(json.dumps({
+                    "span": name, "id": span_id, "parent": parent, "pid": os.getpid(),
+                    "thread": threading.current_thread().name, "start": round(start_time, 6),
+                    "wall_ms": round(wall * 1000, 3), "cpu_ms": round(cpu * 1000, 3), "error": error, **attributes
+                }, default=str) + "\n")
+
+    def summary(self, top_n=SUMMARY_TOP_N):
+        """Prints the spans that took the most wall time (inclusive of nested spans)."""
+        print(f"\n--- Trace summary ({time.perf_counter() - self.started:.1f}s run, inclusive times) ---")
+        print(f"{'Span':<26}{'Calls':>7}{'Wall (s)':>10}{'CPU (s)':>9}{'Errors':>8}{'Sent KB':>9}"
+              f"{'Recv KB':>9}{'Tokens':>9}{'Retries':>9}{'Hits/Misses':>13}")
+        with self.lock:
+            ranked = sorted(self.totals.items(), key=lambda item: -item[1]["wall"])[:top_n]
+        for name, total in ranked:
+            print(f"{name:<26}{total['calls']:>7}{total['wall']:>10.2f}{total['cpu']:>9.2f}{total['errors']:>8}"
+                  f"{total['request_bytes'] / 1024:>9.1f}{total['response_bytes'] / 1024:>9.1f}"
+                  f"{total['tokens']:>9}{total['retries']:>9}"
+                  f"{str(total['cache_hits']) + '/' + str(total['cache_misses']):>13}")
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class SamplingProfiler:
+    """Snapshots every thread's stack at a fixed interval.
+
+    Unlike cProfile, which only sees the thread that enabled it, this also
+    catches work done in worker threads such as asyncio.to_thread calls.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.inclusive = Counter()
+        self.leaf = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                self.samples += 1
+                self.leaf[frame.f_code] += 1
+                seen = set()
+                while frame is not None:
+                    # Thread and event-loop plumbing would otherwise top every report
+                    if frame.f_code not in seen and not frame.f_code.co_filename.startswith(_STDLIB):
+                        self.inclusive[frame.f_code] += 1
+                        seen.add(frame.f_code)
+                    frame = frame.f_back
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def report(self, top_n=PROFILE_TOP_N):
+        print(f"\n--- Sampling profile ({self.samples} thread samples every {self.interval * 1000:.0f} ms) ---")
+        print(f"{'Inclusive (s)':>14}  Function (outside the standard library)")
+        for code, count in self.inclusive.most_common(top_n):
+            print(f"{count * self.interval:>14.2f}  {_describe(code)}")
+        print(f"\n{'Leaf (s)':>14}  Function running when sampled (waits included)")
+        for code, count in self.leaf.most_common(top_n):
+            print(f"{count * self.interval:>14.2f}  {_describe(code)}")
+
+
+def _describe(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+_tracer = Tracer()
+
+
+def get_tracer():
+    """The process-wide tracer; it keeps totals even when no trace file is open."""
+    return _tracer
+
+
+def span(name, **attributes):
+    """with span("vertex.findNeighbors", request_bytes=n) as attrs: ... on the process-wide tracer."""
+    return _tracer.span(name, **attributes)
+
+
+def annotate(**attributes):
+    """Adds attributes to the innermost open span, if there is one."""
+    current = _current_span.get()
+    if current:
+        current[1].update(attributes)
+
+
+def submit(pool, func, *args):
+    """pool.submit(func, *args), keeping the caller's open span as the parent of spans in func."""
+    return pool.submit(contextvars.copy_context().run, func, *args)
+
+
+def add_arguments(parser):
+    """Adds --trace and --profile to an entry point's argument parser."""
+    parser.add_argument("--trace", default=TRACE_PATH, metavar="PATH",
+                        help="Append span records to this JSON-lines file (default: $TRACE_PATH)")
+    parser.add_argument("--profile", choices=("cprofile", "sample"), default=PROFILE_MODE,
+                        help="Profile the run: cProfile on the main thread, or stack sampling of all threads")
+
+
+def start(trace_path=TRACE_PATH, profile=PROFILE_MODE):
+    """Opens the trace file, starts any profiler and prints the summaries when the process exits."""
+    _tracer.open(trace_path)
+    profiler = None
+    if profile == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == "sample":
+        profiler = SamplingProfiler()
+        profiler.start()
+    atexit.register(_finish, profiler, trace_path)
+
+
+def _finish(profiler, trace_path):
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        profiler.dump_stats(PROFILE_PATH)
+        print("\n--- cProfile (main thread, by cumulative time) ---")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+        print(f"✅ Profile saved to {PROFILE_PATH}")
+    elif profiler is not None:
+        profiler.stop()
+        profiler.report()
+    _tracer.summary()
+    _tracer.close()
+    if trace_path:
+        print(f"✅ Trace written to {trace_path}")
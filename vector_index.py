@@ -0,0 +1,271 @@
+import os
+import json
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from clients import http_session
+from embedding_store import EmbeddingFile, write_embeddings, top_k
+from tracing import span, submit
+
+# --- Configuration ---
+VECTOR_INDEX_BACKEND = os.environ.get("VECTOR_INDEX_BACKEND", "vertex") # "vertex" or "local"
+LOCAL_INDEX_PATH = os.environ.get("LOCAL_INDEX_PATH", "vector_index")
+LOCAL_INDEX_MODE = os.environ.get("LOCAL_INDEX_MODE", "exact") # "exact" or "ivf"
+LOCAL_INDEX_DTYPE = os.environ.get("LOCAL_INDEX_DTYPE", "float16") # Stored vectors: "float32", "float16" or "int8"
+IVF_MIN_ROWS = 4096 # Below this an IVF index falls back to exact search
+IVF_NPROBE = 8 # Inverted lists scanned per query
+IVF_RERANK_FACTOR = 4 # Quantized candidates re-scored exactly per requested neighbor
+SCORE_BLOCK_ROWS = 65536 # Rows of the matrix scored per block, bounding peak memory
+MAX_QUERIES_PER_REQUEST = 64 # findNeighbors queries sent in one REST call
+MAX_DATAPOINTS_PER_REQUEST = 1000 # upsertDatapoints/removeDatapoints items per REST call
+MAX_REQUEST_BYTES = 2 * 1024 * 1024 # Serialized request bodies are kept under this
+MAX_PARALLEL_REQUESTS = 4 # Upsert/remove calls in flight at once
+FEATURE_VECTOR_DECIMALS = 5 # Vector values are sent rounded to this many decimal places
+
+# Distances follow Vertex's DOT_PRODUCT_DISTANCE: larger means more similar
+Neighbor = namedtuple("Neighbor", ["id", "distance"])
+
+
+class VertexVectorIndex:
+    """Vertex AI Vector Search over its REST API.
+
+    access_token is either a token string or a callable such as
+    functools.partial(clients.get_access_token, project_id); a callable is
+    asked for a fresh token and the call retried once on a 401. base_url
+    overrides the regional endpoint, e.g. for the benchmark's local stand-in.
+    """
+
+    def __init__(self, access_token, project_id, location, index_id=None,
+                 index_endpoint_id=None, deployed_index_id=None, base_url=None):
+        self.access_token = access_token
+        self.base_url = base_url or (
+            f"https://{location}-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{location}"
+        )
+        self.index_id = index_id
+        self.index_endpoint_id = index_endpoint_id
+        self.deployed_index_id = deployed_index_id
+
+    def _token(self, force_refresh=False):
+        if callable(self.access_token):
+            return self.access_token(force_refresh=force_refresh)
+        return self.access_token
+
+    def _post(self, url, request_body):
+        body = request_body if isinstance(request_body, str) else json.dumps(request_body)
+        with span(f"vertex.{url.rsplit(':', 1)[-1]}", request_bytes=len(body)) as attributes:
+            for attempt in range(2):
+                headers = {
+                    "Authorization": f"Bearer {self._token(force_refresh=attempt > 0)}",
+                    "Content-Type": "application/json"
+                }
+                response = http_session().post(url, headers=headers, data=body)
+                if response.status_code != 401 or not callable(self.access_token):
+                    break
+            attributes.update(response_bytes=len(response.content), status=response.status_code, retries=attempt)
+        if response.status_code != 200:
+            raise RuntimeError(f"Status Code: {response.status_code}\nResponse: {response.text}")
+        return response.json()
+
+    def _post_parallel(self, url, key, items):
+        """Posts JSON-encoded items in size-capped bodies {key: [...]}, several at a time.
+
+        items may be a generator: bodies are built only a couple of rounds
+        ahead of the requests in flight, so they are never all in memory.
+        """
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_REQUESTS) as pool:
+            pending = []
+            for batch in _request_batches(items, MAX_DATAPOINTS_PER_REQUEST):
+                pending.append(submit(pool, self._post, url, f'{{"{key}": [{",".join(batch)}]}}'))
+                if len(pending) >= 2 * MAX_PARALLEL_REQUESTS:
+                    pending.pop(0).result()
+            for future in pending:
+                future.result()
+
+    def upsert(self, ids, vectors):
+        """Upserts (id, vector) pairs; vectors may be any iterable, e.g. rows read from an EmbeddingFile."""
+        datapoints = (
+            json.dumps({"datapointId": i, "featureVector": _feature_vector(v)}) for i, v in zip(ids, vectors)
+        )
+        self._post_parallel(f"{self.base_url}/indexes/{self.index_id}:upsertDatapoints", "datapoints", datapoints)
+
+    def remove(self, ids):
+        self._post_parallel(
+            f"{self.base_url}/indexes/{self.index_id}:removeDatapoints", "datapointIds", (json.dumps(i) for i in ids)
+        )
+
+    def find_neighbors(self, queries, num_neighbors=1):
+        """Sends all queries in as few size-limited findNeighbors calls as possible."""
+        url = f"{self.base_url}/indexEndpoints/{self.index_endpoint_id}:findNeighbors"
+        neighbors = []
+        for batch in _request_batches(
+            [{"datapoint": {"featureVector": _feature_vector(q)}, "neighborCount": num_neighbors} for q in queries],
+            MAX_QUERIES_PER_REQUEST
+        ):
+            result = self._post(url, {"deployedIndexId": self.deployed_index_id, "queries": batch})
+            nearest_list = result.get('nearestNeighbors', [])
+            if len(nearest_list) != len(batch):
+                raise RuntimeError(f"findNeighbors returned {len(nearest_list)} results for {len(batch)} queries")
+            neighbors.extend(
+                [Neighbor(n['datapoint']['datapointId'], n.get('distance', 0.0)) for n in nearest.get('neighbors', [])]
+                for nearest in nearest_list
+            )
+        return neighbors
+
+
+def _feature_vector(vector):
+    """Vector values rounded to FEATURE_VECTOR_DECIMALS, so json.dumps writes "0.01235" rather than 17 digits."""
+    return np.round(np.asarray(vector, dtype=np.float64), FEATURE_VECTOR_DECIMALS).tolist()
+
+
+def _request_batches(items, max_items):
+    """Groups request items (dicts, or strings already JSON-encoded) within the item count and byte limits."""
+    batch, size = [], 0
+    for item in items:
+        item_size = len(item) if isinstance(item, str) else len(json.dumps(item))
+        if batch and (len(batch) >= max_items or size + item_size > MAX_REQUEST_BYTES):
+            yield batch
+            batch, size = [], 0
+        batch.append(item)
+        size += item_size
+    if batch:
+        yield batch
+
+
+def _kmeans(matrix, k, iterations=10, seed=0):
+    """Spherical k-means on dot-product similarity, returning (centroids, assignments)."""
+    rng = np.random.default_rng(seed)
+    centroids = np.array(matrix[rng.choice(len(matrix), k, replace=False)], dtype=np.float32)
+    for _ in range(iterations):
+        assign = np.concatenate([
+            np.argmax(matrix[i:i + SCORE_BLOCK_ROWS] @ centroids.T, axis=1)
+            for i in range(0, len(matrix), SCORE_BLOCK_ROWS)
+        ])
+        for c in range(k):
+            members = matrix[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    return centroids, assign
+
+
+class LocalVectorIndex:
+    """In-process index over a memory-mapped EmbeddingFile (float16 by default).
+
+    Keeps the same string datapoint IDs as the Vertex index. In "ivf" mode an
+    inverted-file index with int8-quantized vectors narrows the search, and
+    the best candidates are re-scored against the stored vectors.
+    """
+
+    def __init__(self, path=LOCAL_INDEX_PATH, mode=LOCAL_INDEX_MODE, dtype=LOCAL_INDEX_DTYPE):
+        self.path = path
+        self.mode = mode
+        self.dtype = dtype
+        self.store_path = os.path.join(path, "embeddings.emb")
+        self.ivf_path = os.path.join(path, "ivf.npz")
+        self._load()
+
+    def _load(self):
+        legacy_matrix, legacy_ids = os.path.join(self.path, "embeddings.npy"), os.path.join(self.path, "ids.json")
+        if not os.path.exists(self.store_path) and os.path.exists(legacy_matrix):
+            # Indexes saved before the embedding file format are converted once
+            with open(legacy_ids, "r") as f:
+                write_embeddings(self.store_path, json.load(f), np.load(legacy_matrix, mmap_mode="r"), self.dtype)
+        if os.path.exists(self.store_path):
+            self.store = EmbeddingFile(self.store_path)
+            self.ids = self.store.id_list()
+        else:
+            self.store = None
+            self.ids = []
+        self.ivf = None
+        if self.mode == "ivf" and os.path.exists(self.ivf_path):
+            self.ivf = dict(np.load(self.ivf_path))
+
+    def _save(self, ids, matrix):
+        os.makedirs(self.path, exist_ok=True)
+        # Written to a temporary file and swapped in, so readers never see a partial index
+        write_embeddings(self.store_path, ids, matrix, self.dtype)
+        if self.mode == "ivf":
+            self._build_ivf(matrix)
+        self._load()
+
+    def _build_ivf(self, matrix):
+        if len(matrix) < IVF_MIN_ROWS:
+            if os.path.exists(self.ivf_path):
+                os.remove(self.ivf_path)
+            return
+        centroids, assign = _kmeans(matrix, int(np.sqrt(len(matrix))))
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+        scales = np.abs(matrix[order]).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(matrix[order] / scales[:, None]).astype(np.int8)
+        np.savez(self.ivf_path + ".tmp.npz", centroids=centroids, order=order,
+                 offsets=offsets, codes=codes, scales=scales.astype(np.float32))
+        os.replace(self.ivf_path + ".tmp.npz", self.ivf_path)
+
+    def upsert(self, ids, vectors):
+        with span("local.upsert", items=len(ids)):
+            self._upsert(ids, vectors)
+
+    def _upsert(self, ids, vectors):
+        vectors = np.asarray(list(vectors), dtype=np.float32)
+        if not len(vectors):
+            return
+        positions = {datapoint_id: row for row, datapoint_id in enumerate(self.ids)}
+        all_ids = list(self.ids)
+        matrix = self.store.block(0, len(self.ids)) if self.ids else np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        appended = []
+        for datapoint_id, vector in zip(ids, vectors):
+            if datapoint_id in positions:
+                matrix[positions[datapoint_id]] = vector
+            else:
+                positions[datapoint_id] = len(all_ids)
+                all_ids.append(datapoint_id)
+                appended.append(vector)
+        if appended:
+            matrix = np.vstack([matrix, np.asarray(appended, dtype=np.float32)])
+        self._save(all_ids, matrix)
+
+    def remove(self, ids):
+        stale = set(ids)
+        keep = [row for row, datapoint_id in enumerate(self.ids) if datapoint_id not in stale]
+        # Nothing stored or nothing matched: leave the index files as they are
+        if len(keep) == len(self.ids):
+            return
+        self._save([self.ids[row] for row in keep], self.store.rows(keep))
+
+    def find_neighbors(self, queries, num_neighbors=1):
+        if not self.ids:
+            return [[] for _ in queries]
+        with span("local.find_neighbors", items=len(queries), mode="ivf" if self.ivf is not None else "exact"):
+            queries = np.asarray(queries, dtype=np.float32)
+            if self.ivf is not None:
+                return [self._search_ivf(q, num_neighbors) for q in queries]
+            return self._search_exact(queries, num_neighbors)
+
+    def _search_exact(self, queries, k):
+        best_rows, best_scores = self.store.search(queries, k)
+        return [
+            [Neighbor(self.ids[r], float(s)) for r, s in zip(rows, scores)]
+            for rows, scores in zip(best_rows, best_scores)
+        ]
+
+    def _search_ivf(self, query, k):
+        ivf = self.ivf
+        probes = top_k((ivf['centroids'] @ query)[None, :], IVF_NPROBE)[0]
+        positions = np.concatenate([np.arange(ivf['offsets'][c], ivf['offsets'][c + 1]) for c in probes])
+        if not len(positions):
+            return []
+        approx = (ivf['codes'][positions].astype(np.float32) @ query) * ivf['scales'][positions]
+        candidates = np.sort(ivf['order'][positions[top_k(approx[None, :], k * IVF_RERANK_FACTOR)[0]]])
+        exact = self.store.rows(candidates) @ query
+        return [Neighbor(self.ids[candidates[t]], float(exact[t])) for t in top_k(exact[None, :], k)[0]]
+
+
+def get_vector_index(backend=None, **vertex_settings):
+    """Returns the configured index backend; vertex_settings go to VertexVectorIndex."""
+    backend = backend or VECTOR_INDEX_BACKEND
+    if backend == "local":
+        return LocalVectorIndex()
+    if backend == "vertex":
+        return VertexVectorIndex(**vertex_settings)
+    raise ValueError(f"Unknown vector index backend: {backend!r}")